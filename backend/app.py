@@ -1,19 +1,50 @@
-from quart import Quart, request, jsonify
+from quart import Quart, Request, request, jsonify, stream_with_context, g
 from quart_cors import cors
 import os
 import aiohttp
 import asyncio
 from bson import ObjectId
 from utils import (
-    allowed_file, process_pdf, ask_llm,
+    allowed_file, extract_document_text, ask_llm, file_sha256,
     patients_collection, UPLOAD_FOLDER, reports_collection
 )
+from jobs import JobQueue, QueueFullError, RetryableError
+from rag_client import RagClient
+from tracing import TRACE_HEADER, span, start_request, finish_request, current_traceparent, run_in_thread
+from bulk import (
+    BulkFormatError, BULK_BATCH_SIZE, BULK_REPORT_BATCH_SIZE,
+    detect_format, iter_records, iter_archive_reports, progress_event, BodyReader
+)
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from quart.wrappers.response import IterableBody
+from typing import Any, Dict
+import io
 import json
+import uuid
+import shutil
+import tarfile
 from datetime import datetime
 import logging
 
+# Bulk import bodies are streamed, so they get their own, much larger limit
+BULK_MAX_CONTENT_LENGTH = int(os.getenv("BULK_MAX_CONTENT_LENGTH", str(10 * 1024 ** 3)))  # 10GB
+
+class AppRequest(Request):
+    """Request whose body limit and timeout depend on the route"""
+
+    def __init__(self, method, scheme, path, *args, max_content_length=None, body_timeout=None, **kwargs):
+        # The body (and its size limit) is created here, before any view runs
+        if path.startswith('/bulk/'):
+            max_content_length = BULK_MAX_CONTENT_LENGTH
+            body_timeout = None
+        super().__init__(
+            method, scheme, path, *args,
+            max_content_length=max_content_length, body_timeout=body_timeout, **kwargs
+        )
+
 app = Quart(__name__)
+app.request_class = AppRequest
 
 # Configure CORS with more permissive settings for development
 app = cors(
@@ -32,30 +63,55 @@ if not os.path.exists(app.config['UPLOAD_FOLDER']):
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB limit
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
 # RAG Service URL
 RAG_SERVICE_URL = "http://localhost:8080"  # Updated port to match RAG service
+RAG_MAX_CONNECTIONS = int(os.getenv("RAG_MAX_CONNECTIONS", "20"))
 
-def index_to_rag(text, metadata):
-    """Index document in RAG system"""
-    try:
-        response = aiohttp.post(
-            f"{RAG_SERVICE_URL}/insert/",
-            json={
-                "content": text,
-                "patient_id": metadata.get("patient_id"),
-                "source": metadata.get("source", "medical_report")
-            }
-        )
-        if response.status != 200:
-            print(f"Error indexing to RAG: {response.text}")
-            return False
-        return True
-    except Exception as e:
-        print(f"Error connecting to RAG service: {str(e)}")
-        return False
+# Shared keep-alive client, opened on startup and closed on shutdown
+rag_client = RagClient(RAG_SERVICE_URL, max_connections=RAG_MAX_CONNECTIONS)
+
+# Background ingestion settings
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "3"))
+
+@app.before_request
+async def begin_trace():
+    """Open a root span per request, continuing the caller's trace if it sent one"""
+    name = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+    g.trace = start_request(name, request.headers.get(TRACE_HEADER))
+
+class TracedBody(IterableBody):
+    """Streamed response body that closes the request's root span once sent"""
+
+    def __init__(self, body: IterableBody, state: Dict[str, Any], status: int):
+        self.iter = body.iter
+        self.state = state
+        self.status = status
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        try:
+            await super().__aexit__(exc_type, exc_value, tb)
+        finally:
+            attributes = {'status': self.status}
+            if exc_value is not None:
+                attributes['error'] = str(exc_value) or type(exc_value).__name__
+            finish_request(self.state, **attributes)
+
+@app.after_request
+async def end_trace(response):
+    state = g.pop('trace', None)
+    if state:
+        response.headers[TRACE_HEADER] = state['span'].traceparent
+        if isinstance(response.response, IterableBody):
+            # Streamed bodies are produced after this hook returns
+            response.response = TracedBody(response.response, state, response.status_code)
+        else:
+            finish_request(state, status=response.status_code)
+    return response
 
 @app.route('/health', methods=['GET'])
 async def health_check():
@@ -108,7 +164,7 @@ async def add_patient():
     """Add a new patient"""
     try:
         patient_data = await request.get_json()
-        logger.info(f"Adding new patient: {patient_data}")
+        logger.info("Adding new patient")
         
         # Validate required fields
         if not patient_data.get('name'):
@@ -143,7 +199,7 @@ async def get_patient_documents(patient_id):
                 'filename': doc['filename'],
                 'category': doc['file_category'],
                 'uploadDate': doc['upload_date'],
-                'textContent': doc['text_content'][:200] + '...' if len(doc['text_content']) > 200 else doc['text_content']
+                'textContent': preview(report_text(doc))
             })
             
         logger.info(f"Found {len(formatted_docs)} documents")
@@ -163,15 +219,22 @@ async def delete_document(document_id):
         if not document:
             return jsonify({'error': 'Document not found'}), 404
             
-        # Delete document from RAG system
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(
-                f"{RAG_SERVICE_URL}/delete/",
-                json={"document_id": document_id}
-            ) as response:
-                if response.status != 200:
-                    logger.error("Failed to delete document from RAG")
-                    return jsonify({'error': 'Failed to delete document from RAG system'}), 500
+        # Reports with the same extracted text share one RAG document, which
+        # is removed together with the last report referencing it
+        rag_document_id = document.get('rag_document_id')
+        if not rag_document_id:
+            logger.warning(f"Report {document_id} has no RAG document id, deleting it locally only")
+        elif not rag_references(document):
+            # Delete document from RAG system
+            status, _ = await rag_client.delete(rag_document_id)
+            if status != 200:
+                logger.error("Failed to delete document from RAG")
+                return jsonify({'error': 'Failed to delete document from RAG system'}), 500
+
+        if not document.get('duplicate_of'):
+            duplicates = reports_collection.find('reports', {'duplicate_of': document_id})
+            if duplicates:
+                promote_duplicate(document, duplicates)
         
         # Delete from reports collection
         reports_collection.delete_one('reports', {'_id': document_id})
@@ -182,15 +245,165 @@ async def delete_document(document_id):
         logger.error(f"Error deleting document: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+async def process_upload(job):
+    """Ingestion job handler: extract text, index it in RAG and store the report"""
+    # Continue the trace of the /extract-text request that queued the job
+    with span("ingest_job", traceparent=job.payload.get('traceparent'), job_id=job.id, attempt=job.attempts):
+        return await _process_upload(job)
+
+async def _process_upload(job):
+    payload = job.payload
+    filepath = payload['filepath']
+    filename = payload['filename']
+
+    # The same file may have been ingested while this job was queued
+    original = find_duplicate_report(payload['patient_id'], payload['file_hash'])
+    if original:
+        return add_duplicate_report(original, payload)
+
+    # Extract text from file
+    logger.info(f"Job {job.id}: extracting text from {filename}")
+    if not os.path.exists(filepath):
+        raise ValueError('Uploaded file is no longer available')
+    with span("extract_text", filename=filename) as extract_span:
+        extracted_text = await run_in_thread(extract_document_text, filepath)
+        extract_span.set(chars=len(extracted_text))
+
+    if not extracted_text:
+        raise ValueError('No text could be extracted from the file')
+
+    # Index document in RAG system
+    logger.info(f"Job {job.id}: indexing document in RAG system")
+    try:
+        status, rag_response = await rag_client.insert(extracted_text, {
+            "patient_id": payload['patient_id'],
+            "file_category": payload['file_category'],
+            "filename": filename,
+            "upload_date": payload['upload_date']
+        })
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise RetryableError(f"Failed to reach RAG service: {str(e) or type(e).__name__}")
+    # Server errors may clear up; a rejected request will be rejected again
+    if status >= 500:
+        raise RetryableError(f"RAG service returned {status}")
+    if status != 200:
+        raise ValueError(f"RAG service rejected the document ({status})")
+
+    # The RAG service fingerprints the extracted text and skips re-embedding
+    # content it already holds for this patient; duplicates share its key
+    rag_response = rag_response if isinstance(rag_response, dict) else {}
+    duplicate = bool(rag_response.get('duplicate'))
+
+    # Save report to in-memory database
+    report = {
+        'patient_id': payload['patient_id'],
+        'filename': filename,
+        'file_category': payload['file_category'],
+        'upload_date': payload['upload_date'],
+        'text_content': extracted_text,
+        'file_hash': payload['file_hash'],
+        'rag_document_id': rag_response.get('document_id')
+    }
+    reports_collection.insert_one('reports', report)
+
+    logger.info(f"Job {job.id}: file processed successfully")
+    return {
+        'document_id': report['_id'],
+        'duplicate': duplicate,
+        'text': preview(extracted_text)
+    }
+
+def preview(text):
+    return text[:200] + '...' if len(text) > 200 else text
+
+def report_text(report):
+    """Extracted text of a report; duplicates read it from the report they reference"""
+    if report.get('duplicate_of'):
+        original = reports_collection.find_one('reports', {'_id': report['duplicate_of']})
+        return original.get('text_content', '') if original else ''
+    return report.get('text_content', '')
+
+def rag_references(report):
+    """Other reports sharing the report's RAG document"""
+    return [
+        other for other in reports_collection.find('reports', {'rag_document_id': report['rag_document_id']})
+        if other['_id'] != report['_id']
+    ]
+
+def promote_duplicate(original, duplicates):
+    """Hand an original's text and RAG vectors to its first duplicate before the original is deleted"""
+    heir = duplicates[0]
+    reports_collection.update_one('reports', {'_id': heir['_id']}, {
+        'text_content': original.get('text_content', ''),
+        'duplicate_of': None
+    })
+    for duplicate in duplicates[1:]:
+        reports_collection.update_one('reports', {'_id': duplicate['_id']}, {'duplicate_of': heir['_id']})
+
+def find_duplicate_report(patient_id, file_hash):
+    """Find an already ingested report with identical file content for the patient"""
+    return reports_collection.find_one('reports', {
+        'patient_id': patient_id,
+        'file_hash': file_hash,
+        'duplicate_of': None
+    })
+
+def add_duplicate_report(original, payload):
+    """Record a duplicate upload as a reference to the original report"""
+    logger.info(f"Duplicate of report {original['_id']} detected, skipping re-ingest")
+    report = {
+        'patient_id': payload['patient_id'],
+        'filename': payload['filename'],
+        'file_category': payload['file_category'],
+        'upload_date': payload['upload_date'],
+        'file_hash': payload['file_hash'],
+        'duplicate_of': original['_id'],
+        'rag_document_id': original.get('rag_document_id')
+    }
+    reports_collection.insert_one('reports', report)
+    return {
+        'document_id': report['_id'],
+        'duplicate': True,
+        'duplicate_of': original['_id'],
+        'text': preview(report_text(original))
+    }
+
+def finish_upload(job):
+    """Clean up the saved upload once its job has completed or permanently failed"""
+    _remove_upload(job.payload['filepath'])
+
+def _remove_upload(filepath):
+    """Clean up a saved upload"""
+    if os.path.exists(filepath):
+        os.remove(filepath)
+        logger.info("Cleaned up temporary file")
+
+ingestion_queue = JobQueue(
+    process_upload,
+    workers=INGEST_WORKERS,
+    max_size=INGEST_QUEUE_SIZE,
+    max_retries=INGEST_MAX_RETRIES,
+    on_finish=finish_upload
+)
+
+@app.before_serving
+async def startup():
+    await rag_client.start()
+    await ingestion_queue.start()
+
+@app.after_serving
+async def shutdown():
+    await ingestion_queue.stop()
+    await rag_client.close()
+
 @app.route('/extract-text', methods=['POST'])
 async def extract_text():
-    """Extract text from uploaded file and index it in RAG"""
+    """Accept an uploaded file and queue it for extraction and RAG indexing"""
     try:
         logger.info("Received file upload request")
         
         # Check if the post request has the file part
         files = await request.files
-        logger.debug(f"Request files: {files}")
         
         if 'file' not in files:
             logger.error("No file part in request")
@@ -207,7 +420,6 @@ async def extract_text():
 
         # Get form data
         form = await request.form
-        logger.debug(f"Form data: {form}")
         
         patient_id = form.get('patient_id')
         file_category = form.get('file_category')
@@ -220,69 +432,255 @@ async def extract_text():
         if not os.path.exists(app.config['UPLOAD_FOLDER']):
             os.makedirs(app.config['UPLOAD_FOLDER'])
 
-        # Save the file
+        # Save the file under a unique name so concurrent uploads don't collide
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
         logger.info(f"Saving file to: {filepath}")
         
         await file.save(filepath)
-        logger.info("File saved successfully")
+
+        file_hash = await run_in_thread(file_sha256, filepath)
+        payload = {
+            'filepath': filepath,
+            'filename': filename,
+            'patient_id': patient_id,
+            'file_category': file_category,
+            'upload_date': datetime.now().isoformat(),
+            'file_hash': file_hash,
+            'traceparent': current_traceparent()
+        }
+
+        # An identical file already ingested for this patient becomes a reference
+        original = find_duplicate_report(patient_id, file_hash)
+        if original:
+            _remove_upload(filepath)
+            result = add_duplicate_report(original, payload)
+            return jsonify({'message': 'Duplicate document detected', **result}), 200
+
+        # Re-submitting the same file for the same patient returns the existing job
+        idempotency_key = request.headers.get('Idempotency-Key') or \
+            f"{patient_id}:{file_category}:{file_hash}"
 
         try:
-            # Extract text from file
-            logger.info("Extracting text from file")
-            extracted_text = process_pdf(filepath) if filename.lower().endswith('.pdf') else ""
-            
-            if not extracted_text:
-                logger.error("No text could be extracted")
-                return jsonify({'error': 'No text could be extracted from the file'}), 400
-
-            # Index document in RAG system
-            logger.info("Indexing document in RAG system")
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-                async with session.post(
-                    f"{RAG_SERVICE_URL}/insert/",
-                    json={
-                        "content": extracted_text,
-                        "metadata": {
-                            "patient_id": patient_id,
-                            "file_category": file_category,
-                            "filename": filename,
-                            "upload_date": datetime.now().isoformat()
-                        }
-                    }
-                ) as response:
-                    if response.status != 200:
-                        logger.error("Failed to index document in RAG")
-                        return jsonify({'error': 'Failed to index document in RAG system'}), 500
-                        
-                    # Save report to in-memory database
-                    logger.info("Saving report to database")
-                    report = {
-                        'patient_id': patient_id,
-                        'filename': filename,
-                        'file_category': file_category,
-                        'upload_date': datetime.now().isoformat(),
-                        'text_content': extracted_text
-                    }
-                    reports_collection.insert_one('reports', report)
-                    
-                    logger.info("File processed successfully")
-                    return jsonify({
-                        'message': 'File processed successfully',
-                        'text': extracted_text[:200] + '...' if len(extracted_text) > 200 else extracted_text
-                    }), 200
+            job, created = ingestion_queue.submit(payload, idempotency_key=idempotency_key)
+        except QueueFullError as e:
+            _remove_upload(filepath)
+            return jsonify({'error': str(e)}), 503
 
-        finally:
-            # Clean up uploaded file
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                logger.info("Cleaned up temporary file")
+        if not created:
+            _remove_upload(filepath)
 
+        logger.info(f"Queued ingestion job {job.id}")
+        return jsonify({
+            'message': 'File accepted for processing',
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f"/jobs/{job.id}"
+        }), 202
+
+    except RequestEntityTooLarge:
+        logger.error("Uploaded file exceeds the size limit")
+        return jsonify({'error': 'File too large'}), 413
     except Exception as e:
         logger.error(f"Error processing file: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    """Get the status of an ingestion job"""
+    job = ingestion_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Ingestion queue metrics"""
+    return jsonify({'ingestion': ingestion_queue.metrics()}), 200
+
+def prepare_patient(patient_data):
+    """Apply the default fields and timestamps every new patient gets"""
+    patient_data.setdefault('age', None)
+    patient_data.setdefault('gender', None)
+    patient_data.setdefault('contact', None)
+    patient_data.setdefault('medical_history', [])
+    patient_data['created_at'] = datetime.now().isoformat()
+    patient_data['updated_at'] = patient_data['created_at']
+    return patient_data
+
+# Only the first few row errors are echoed back in the final progress event
+MAX_REPORTED_ERRORS = 100
+
+@app.route('/bulk/patients', methods=['POST'])
+async def bulk_import_patients():
+    """Import patients from a streamed NDJSON or CSV body, streaming NDJSON progress back"""
+    try:
+        fmt = detect_format(request.headers.get('Content-Type'))
+    except BulkFormatError as e:
+        return jsonify({'error': str(e)}), 415
+
+    @stream_with_context
+    async def run():
+        processed = inserted = failed = 0
+        errors = []
+        batch = []
+        async for line_no, record in iter_records(request.body, fmt):
+            processed += 1
+            if isinstance(record, BulkFormatError) or not record.get('name'):
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    message = str(record) if isinstance(record, BulkFormatError) else 'Patient name is required'
+                    errors.append({'line': line_no, 'error': message})
+                continue
+
+            batch.append(prepare_patient(record))
+            if len(batch) >= BULK_BATCH_SIZE:
+                patients_collection.insert_many('patients', batch)
+                inserted += len(batch)
+                batch = []
+                yield progress_event(processed=processed, inserted=inserted, failed=failed)
+
+        if batch:
+            patients_collection.insert_many('patients', batch)
+            inserted += len(batch)
+
+        logger.info(f"Bulk patient import finished: {inserted} inserted, {failed} failed")
+        yield progress_event(done=True, processed=processed, inserted=inserted, failed=failed, errors=errors)
+
+    return run(), 200, {'Content-Type': 'application/x-ndjson'}
+
+async def flush_report_batch(batch):
+    """Index a batch of extracted reports in RAG with one call, then store them"""
+    status, rag_response = await rag_client.insert_batch([
+        {
+            "content": text,
+            "metadata": {
+                "patient_id": payload['patient_id'],
+                "file_category": payload['file_category'],
+                "filename": payload['filename'],
+                "upload_date": payload['upload_date']
+            }
+        }
+        for text, payload in batch
+    ])
+    if status != 200:
+        raise RuntimeError(f"RAG service returned {status}")
+    results = rag_response.get('results', [])
+    if len(results) != len(batch):
+        raise RuntimeError(f"RAG service returned {len(results)} results for {len(batch)} documents")
+
+    reports_collection.insert_many('reports', [
+        {
+            'patient_id': payload['patient_id'],
+            'filename': payload['filename'],
+            'file_category': payload['file_category'],
+            'upload_date': payload['upload_date'],
+            'text_content': text,
+            'file_hash': payload['file_hash'],
+            'rag_document_id': result.get('document_id')
+        }
+        for (text, payload), result in zip(batch, results)
+    ])
+    return sum(1 for result in results if result.get('duplicate'))
+
+def _save_archive_member(fileobj, filepath):
+    with open(filepath, 'wb') as f:
+        shutil.copyfileobj(fileobj, f)
+
+@app.route('/bulk/reports', methods=['POST'])
+async def bulk_import_reports():
+    """Import reports from a streamed tar archive laid out as <patient_id>/[<file_category>/]<filename>"""
+    default_category = request.args.get('file_category', 'imported')
+
+    if not os.path.exists(app.config['UPLOAD_FOLDER']):
+        os.makedirs(app.config['UPLOAD_FOLDER'])
+
+    @stream_with_context
+    async def run():
+        processed = inserted = duplicates = failed = 0
+        errors = []
+        batch = []
+
+        def record_error(name, message):
+            nonlocal failed
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'file': name, 'error': message})
+
+        try:
+            # Read the archive straight from the body, so progress starts with
+            # the first reports and nothing is spooled to disk; the tar is
+            # parsed in worker threads, which wait for body chunks as needed
+            body = io.BufferedReader(BodyReader(request.body, asyncio.get_running_loop()))
+            members = iter_archive_reports(body, default_category)
+            while True:
+                item = await run_in_thread(next, members, None)
+                if item is None:
+                    break
+                name, metadata, fileobj = item
+                processed += 1
+
+                if not allowed_file(metadata['filename']):
+                    record_error(name, 'Invalid file type')
+                    continue
+
+                filename = secure_filename(metadata['filename'])
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
+                try:
+                    await run_in_thread(_save_archive_member, fileobj, filepath)
+                    payload = {
+                        'patient_id': metadata['patient_id'],
+                        'file_category': metadata['file_category'],
+                        'filename': filename,
+                        'upload_date': datetime.now().isoformat(),
+                        'file_hash': await run_in_thread(file_sha256, filepath)
+                    }
+                    original = find_duplicate_report(payload['patient_id'], payload['file_hash'])
+                    if original:
+                        add_duplicate_report(original, payload)
+                        duplicates += 1
+                        continue
+                    extracted_text = await run_in_thread(extract_document_text, filepath)
+                finally:
+                    _remove_upload(filepath)
+
+                if not extracted_text:
+                    record_error(name, 'No text could be extracted from the file')
+                    continue
+
+                batch.append((extracted_text, payload))
+                if len(batch) >= BULK_REPORT_BATCH_SIZE:
+                    try:
+                        duplicates += await flush_report_batch(batch)
+                        inserted += len(batch)
+                    except Exception as e:
+                        for _, failed_payload in batch:
+                            record_error(failed_payload['filename'], str(e))
+                    batch = []
+                    yield progress_event(
+                        processed=processed, inserted=inserted, duplicates=duplicates, failed=failed
+                    )
+
+            if batch:
+                try:
+                    duplicates += await flush_report_batch(batch)
+                    inserted += len(batch)
+                except Exception as e:
+                    for _, failed_payload in batch:
+                        record_error(failed_payload['filename'], str(e))
+
+        except tarfile.TarError as e:
+            logger.error(f"Invalid report archive: {str(e)}")
+            record_error(None, f"Invalid archive: {str(e)}")
+
+        logger.info(f"Bulk report import finished: {inserted} inserted, {duplicates} duplicates, {failed} failed")
+        yield progress_event(
+            done=True, processed=processed, inserted=inserted,
+            duplicates=duplicates, failed=failed, errors=errors
+        )
+
+    return run(), 200, {'Content-Type': 'application/x-ndjson'}
+
 @app.route('/patients', methods=['GET'])
 async def get_patients():
     """Get all patients"""
@@ -298,7 +696,7 @@ async def get_patient_reports(patient_id):
     """Get all reports for a patient"""
     try:
         reports = reports_collection.find('reports', {'patient_id': patient_id})
-        return jsonify(reports), 200
+        return jsonify([{**report, 'text_content': report_text(report)} for report in reports]), 200
     except Exception as e:
         logger.error(f"Error getting reports: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -311,30 +709,19 @@ async def chat():
         if not data or not data.get('query'):
             return jsonify({'error': 'Query is required'}), 400
             
-        # Set a timeout for the RAG service request
-        timeout = aiohttp.ClientTimeout(total=10)  # 10 second timeout
-        
         # Forward the request to RAG service
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(
-                f"{RAG_SERVICE_URL}/search/",
-                json={
-                    "query": data['query'],
-                    "patient_id": data.get('patient_id')
-                }
-            ) as response:
-                if response.status != 200:
-                    return jsonify({'error': 'RAG service error'}), response.status
-                    
-                rag_response = await response.json()
-                if rag_response.get('status') == 'error':
-                    return jsonify({
-                        'error': rag_response.get('message', 'Unknown error')
-                    }), 400
-                    
-                return jsonify({
-                    'answer': rag_response.get('answer', 'No answer found')
-                }), 200
+        status, rag_response = await rag_client.search(data['query'], data.get('patient_id'))
+        if status != 200:
+            return jsonify({'error': 'RAG service error'}), status
+            
+        if rag_response.get('status') == 'error':
+            return jsonify({
+                'error': rag_response.get('message', 'Unknown error')
+            }), 400
+            
+        return jsonify({
+            'answer': rag_response.get('answer', 'No answer found')
+        }), 200
         
     except asyncio.TimeoutError:
         return jsonify({'error': 'Request timed out'}), 504
@@ -0,0 +1,159 @@
+import io
+import csv
+import json
+import asyncio
+import logging
+import tarfile
+from typing import Any, AsyncIterator, Dict, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bulk import configuration
+BULK_BATCH_SIZE = 500
+BULK_REPORT_BATCH_SIZE = 16
+
+
+class BulkFormatError(Exception):
+    """Raised when a bulk import body cannot be parsed"""
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a streamed request body into lines without buffering the whole body"""
+    remainder = b''
+    async for chunk in chunks:
+        remainder += chunk
+        lines = remainder.split(b'\n')
+        remainder = lines.pop()
+        for line in lines:
+            yield line.rstrip(b'\r')
+    if remainder:
+        yield remainder.rstrip(b'\r')
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, Any]]:
+    """Parse a streamed NDJSON or CSV body into (line number, record) pairs.
+
+    Malformed lines are yielded as (line number, BulkFormatError) so the
+    import can report them and carry on. A CSV record whose quoted fields
+    span several lines is reported under its first line number.
+    """
+    header = None
+    line_no = 0
+    pending = []  # physical lines of a CSV record with an open quoted field
+    quotes = 0
+    async for raw_line in iter_lines(chunks):
+        line_no += 1
+        try:
+            line = raw_line.decode('utf-8')
+        except UnicodeDecodeError as e:
+            pending, quotes = [], 0
+            yield line_no, BulkFormatError(f"Invalid UTF-8: {str(e)}")
+            continue
+        if not line.strip() and not pending:
+            continue
+        if fmt == 'ndjson':
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, BulkFormatError(f"Invalid JSON: {str(e)}")
+                continue
+            if not isinstance(record, dict):
+                yield line_no, BulkFormatError("Expected a JSON object")
+                continue
+            yield line_no, record
+        else:
+            # Doubled quotes keep the count even, so an odd total means a
+            # quoted field continues on the next line
+            pending.append(line + '\n')
+            quotes += line.count('"')
+            if quotes % 2:
+                continue
+            record_line_no = line_no - len(pending) + 1
+            try:
+                row = next(csv.reader(pending))
+            except csv.Error as e:
+                yield record_line_no, BulkFormatError(f"Invalid CSV: {str(e)}")
+                continue
+            finally:
+                pending, quotes = [], 0
+            if header is None:
+                header = [column.strip() for column in row]
+                continue
+            if len(row) != len(header):
+                yield record_line_no, BulkFormatError(f"Expected {len(header)} columns, got {len(row)}")
+                continue
+            yield record_line_no, {k: v for k, v in zip(header, row) if v != ''}
+
+    if pending:
+        yield line_no - len(pending) + 1, BulkFormatError("Unterminated quoted field")
+
+
+def detect_format(content_type: str) -> str:
+    """Map a request Content-Type to a bulk record format"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json'):
+        return 'ndjson'
+    raise BulkFormatError(f"Unsupported content type: {content_type or 'none'} (use text/csv or application/x-ndjson)")
+
+
+class BodyReader(io.RawIOBase):
+    """Blocking file object over a streamed request body.
+
+    For use from a worker thread: each read waits for the next body chunk
+    on the event loop, so the body is consumed as it arrives.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop):
+        self.chunks = chunks.__aiter__()
+        self.loop = loop
+        self.buffer = b''
+        self.finished = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        while not self.buffer and not self.finished:
+            try:
+                self.buffer = asyncio.run_coroutine_threadsafe(anext(self.chunks), self.loop).result()
+            except StopAsyncIteration:
+                self.finished = True
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def iter_archive_reports(fileobj, default_category: str) -> Iterator[Tuple[str, Dict[str, str], Any]]:
+    """Iterate report files in a tar archive laid out as <patient_id>/[<file_category>/]<filename>.
+
+    The archive is read sequentially from `fileobj`, one member at a time,
+    so it can come straight from the request body. Yields (member name,
+    metadata, file object) for each regular file.
+    """
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            parts = [p for p in member.name.split('/') if p and p != '.']
+            if len(parts) == 2:
+                patient_id, filename = parts
+                file_category = default_category
+            elif len(parts) == 3:
+                patient_id, file_category, filename = parts
+            else:
+                logger.warning(f"Skipping archive member with unexpected path: {member.name}")
+                continue
+            yield member.name, {
+                'patient_id': patient_id,
+                'file_category': file_category,
+                'filename': filename
+            }, archive.extractfile(member)
+
+
+def progress_event(**fields) -> bytes:
+    """Encode a progress update as one NDJSON line"""
+    return (json.dumps(fields) + '\n').encode('utf-8')
+
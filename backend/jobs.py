@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import random
+import uuid
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Job states
+PENDING = 'pending'
+RUNNING = 'running'
+RETRYING = 'retrying'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+class RetryableError(Exception):
+    """Raised by a job handler when the failure is transient and the job should be retried"""
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity"""
+
+
+@dataclass
+class Job:
+    id: str
+    payload: Dict[str, Any]
+    idempotency_key: Optional[str] = None
+    status: str = PENDING
+    attempts: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public view of the job (payload is internal)"""
+        data = asdict(self)
+        data.pop('payload')
+        return data
+
+
+class JobQueue:
+    """Bounded in-process job queue drained by a fixed pool of async workers"""
+
+    def __init__(
+        self,
+        handler: Callable[[Job], Awaitable[Dict[str, Any]]],
+        workers: int = 4,
+        max_size: int = 100,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        max_history: int = 1000,
+        on_finish: Optional[Callable[[Job], None]] = None
+    ):
+        self.handler = handler
+        self.on_finish = on_finish
+        self.num_workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_history = max_history
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, str] = {}
+        self._workers = []
+        self._active = 0
+
+    async def start(self):
+        """Start the worker pool"""
+        for i in range(self.num_workers):
+            self._workers.append(asyncio.create_task(self._worker(i)))
+        logger.info(f"Started {self.num_workers} ingestion workers")
+
+    async def stop(self):
+        """Cancel the worker pool"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, payload: Dict[str, Any], idempotency_key: Optional[str] = None) -> Tuple[Job, bool]:
+        """Enqueue a job, returning (job, created).
+
+        If a job with the same idempotency key exists and has not failed, that
+        job is returned instead of enqueueing a new one.
+        """
+        if idempotency_key and idempotency_key in self._by_key:
+            existing = self.jobs.get(self._by_key[idempotency_key])
+            if existing and existing.status != FAILED:
+                return existing, False
+
+        job = Job(id=uuid.uuid4().hex, payload=payload, idempotency_key=idempotency_key)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Ingestion queue is full, try again later")
+
+        self.jobs[job.id] = job
+        if idempotency_key:
+            self._by_key[idempotency_key] = job.id
+        self._prune()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def metrics(self) -> Dict[str, int]:
+        counts = {PENDING: 0, RUNNING: 0, RETRYING: 0, COMPLETED: 0, FAILED: 0}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {
+            'queue_depth': self.depth(),
+            'queue_capacity': self.queue.maxsize,
+            'active_workers': self._active,
+            'workers': self.num_workers,
+            **counts
+        }
+
+    def _prune(self):
+        """Forget the oldest finished jobs once history exceeds max_history"""
+        excess = len(self.jobs) - self.max_history
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self.jobs.values() if j.status in (COMPLETED, FAILED)][:excess]:
+            job = self.jobs.pop(job_id)
+            if job.idempotency_key and self._by_key.get(job.idempotency_key) == job_id:
+                del self._by_key[job.idempotency_key]
+
+    def _set_status(self, job: Job, status: str):
+        job.status = status
+        job.updated_at = datetime.now().isoformat()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self.queue.get()
+            self._active += 1
+            try:
+                await self._run(job)
+                if self.on_finish:
+                    self.on_finish(job)
+            except Exception as e:
+                logger.error(f"Error finishing job {job.id}: {str(e)}")
+            finally:
+                self._active -= 1
+                self.queue.task_done()
+
+    async def _run(self, job: Job):
+        while True:
+            job.attempts += 1
+            self._set_status(job, RUNNING)
+            try:
+                job.result = await self.handler(job)
+                job.error = None
+                self._set_status(job, COMPLETED)
+                logger.info(f"Job {job.id} completed after {job.attempts} attempt(s)")
+                return
+            except RetryableError as e:
+                job.error = str(e)
+                if job.attempts > self.max_retries:
+                    self._set_status(job, FAILED)
+                    logger.error(f"Job {job.id} failed after {job.attempts} attempts: {job.error}")
+                    return
+                self._set_status(job, RETRYING)
+                # Exponential backoff with jitter
+                delay = self.retry_delay * (2 ** (job.attempts - 1)) * (0.5 + random.random())
+                logger.warning(f"Job {job.id} attempt {job.attempts} failed, retrying in {delay:.1f}s: {job.error}")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                job.error = str(e)
+                self._set_status(job, FAILED)
+                logger.error(f"Job {job.id} failed: {job.error}")
+                return
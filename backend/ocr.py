@@ -0,0 +1,138 @@
+import os
+import io
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+import pytesseract
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# OCR configuration
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "ocr_cache")
+# Rendered pages queued for the pool per document
+OCR_IN_FLIGHT = int(os.getenv("OCR_IN_FLIGHT", str(OCR_WORKERS * 2)))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Lazily create the shared OCR process pool.
+
+    Extraction runs in worker threads, so the pool is started with "spawn":
+    forking a multi-threaded process can copy locks (e.g. logging's) held by
+    another thread and deadlock the child.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _ocr_image_bytes(image_bytes: bytes, lang: str) -> str:
+    """Run Tesseract on an encoded image (executed in a worker process)"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return pytesseract.image_to_string(image, lang=lang)
+
+
+def _cache_key(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b'\0')
+    digest.update(OCR_LANG.encode())
+    return digest.hexdigest()
+
+
+def _cache_get(key: str) -> Optional[str]:
+    path = os.path.join(OCR_CACHE_DIR, f"{key}.txt")
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    return None
+
+
+def _cache_put(key: str, text: str):
+    os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+    path = os.path.join(OCR_CACHE_DIR, f"{key}.txt")
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _ocr_cached(keys: List[str], render: Callable[[int], bytes]) -> List[str]:
+    """OCR the images whose cache keys miss; `render(i)` produces image i only when needed.
+
+    At most OCR_IN_FLIGHT rendered images are queued for the pool at a time,
+    so a long scan is not held in memory all at once.
+    """
+    results: List[Optional[str]] = [_cache_get(key) for key in keys]
+
+    pending = [i for i, text in enumerate(results) if text is None]
+    if pending:
+        logger.info(f"Running OCR on {len(pending)} image(s), {len(keys) - len(pending)} cached")
+        executor = _get_executor()
+        remaining = iter(pending)
+        in_flight: Dict[Future, int] = {}
+
+        def submit_next() -> bool:
+            i = next(remaining, None)
+            if i is None:
+                return False
+            in_flight[executor.submit(_ocr_image_bytes, render(i), OCR_LANG)] = i
+            return True
+
+        while len(in_flight) < OCR_IN_FLIGHT and submit_next():
+            pass
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = in_flight.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    logger.error(f"Error running OCR: {str(e)}")
+                    results[i] = ""
+                else:
+                    results[i] = text
+                    _cache_put(keys[i], text)
+                submit_next()
+
+    return [text or "" for text in results]
+
+
+def ocr_images(images: List[bytes]) -> List[str]:
+    """OCR encoded images in parallel, reusing cached results by content hash"""
+    return _ocr_cached([_cache_key(image) for image in images], lambda i: images[i])
+
+
+def ocr_pdf_pages(pdf_document, page_numbers: List[int], source_hash: str, dpi: int = OCR_DPI) -> Dict[int, str]:
+    """OCR the given PDF pages in parallel.
+
+    Results are cached by the PDF's content hash, page number and DPI, so
+    pages of a re-uploaded file are not rendered again.
+    """
+    def render(i: int) -> bytes:
+        pixmap = pdf_document.load_page(page_numbers[i]).get_pixmap(dpi=dpi)
+        return pixmap.tobytes("png")
+
+    keys = [_cache_key(source_hash, page_num, dpi) for page_num in page_numbers]
+    return dict(zip(page_numbers, _ocr_cached(keys, render)))
+
+
+def ocr_image_file(filepath: str) -> str:
+    """OCR an uploaded image file"""
+    with open(filepath, 'rb') as f:
+        return ocr_images([f.read()])[0]
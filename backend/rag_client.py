@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from tracing import span, trace_headers
+
+logger = logging.getLogger(__name__)
+
+# Per-route timeouts (seconds)
+ROUTE_TIMEOUTS = {
+    '/search/': 10,
+    '/insert/': 30,
+    '/insert/batch/': 120,
+    '/delete/': 10,
+}
+DEFAULT_TIMEOUT = 30
+
+
+class RagClient:
+    """Application-scoped, keep-alive HTTP client for the RAG service"""
+
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = 20,
+        keepalive_timeout: float = 30.0,
+        max_retries: int = 2,
+        retry_delay: float = 0.2
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        """Create the shared session (call from app startup)"""
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT)
+        )
+        logger.info(f"RAG client started (max {self.max_connections} connections to {self.base_url})")
+
+    async def close(self):
+        """Close the shared session (call from app shutdown)"""
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        json: Optional[Dict[str, Any]] = None,
+        idempotent: bool = False,
+        retry_timeouts: bool = True
+    ) -> Tuple[int, Any]:
+        """Send a request to the RAG service and return (status, body).
+
+        Idempotent calls are retried with jittered exponential backoff on
+        connection errors, timeouts (unless retry_timeouts is False) and 5xx
+        responses. The route timeout is one deadline shared by all attempts.
+        """
+        if self.session is None:
+            raise RuntimeError("RAG client is not started")
+
+        with span(f"rag {method} {path}") as call_span:
+            status, body = await self._request(method, path, json, idempotent, retry_timeouts)
+            call_span.set(status=status)
+            return status, body
+
+    async def _request(self, method: str, path: str, json: Optional[Dict[str, Any]],
+                       idempotent: bool, retry_timeouts: bool) -> Tuple[int, Any]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ROUTE_TIMEOUTS.get(path, DEFAULT_TIMEOUT)
+        headers = trace_headers()
+        attempts = self.max_retries + 1 if idempotent else 1
+        for attempt in range(1, attempts + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                async with self.session.request(
+                    method, f"{self.base_url}{path}", json=json, headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=remaining)
+                ) as response:
+                    if response.status >= 500 and attempt < attempts:
+                        logger.warning(f"RAG {method} {path} returned {response.status}, retrying")
+                    else:
+                        try:
+                            body = await response.json()
+                        except (aiohttp.ContentTypeError, ValueError):
+                            body = await response.text()
+                        return response.status, body
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= attempts or (isinstance(e, asyncio.TimeoutError) and not retry_timeouts):
+                    raise
+                logger.warning(f"RAG {method} {path} failed ({type(e).__name__}), retrying")
+
+            delay = self.retry_delay * (2 ** (attempt - 1))
+            await asyncio.sleep(random.uniform(0, delay))
+
+    async def search(self, query: str, patient_id: Optional[str] = None) -> Tuple[int, Any]:
+        # The RAG service drops LLM work we will no longer wait for. A timed
+        # out search is still generating there, so retrying would only queue
+        # the same LLM work again
+        return await self.request(
+            'POST', '/search/',
+            json={"query": query, "patient_id": patient_id, "timeout": ROUTE_TIMEOUTS['/search/']},
+            idempotent=True,
+            retry_timeouts=False
+        )
+
+    async def insert(self, content: str, metadata: Dict[str, Any]) -> Tuple[int, Any]:
+        return await self.request('POST', '/insert/', json={"content": content, "metadata": metadata})
+
+    async def insert_batch(self, documents: List[Dict[str, Any]]) -> Tuple[int, Any]:
+        """Insert [{"content": ..., "metadata": {...}}, ...] in one call"""
+        return await self.request('POST', '/insert/batch/', json={"documents": documents})
+
+    async def delete(self, document_id: str) -> Tuple[int, Any]:
+        return await self.request(
+            'DELETE', '/delete/', json={"document_id": document_id}, idempotent=True
+        )
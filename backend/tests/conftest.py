@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py creates its upload folder in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix="backend-tests-"))
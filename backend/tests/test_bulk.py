@@ -0,0 +1,142 @@
+import io
+import os
+import json
+import asyncio
+import tarfile
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import app as backend
+from bulk import BulkFormatError, iter_records
+
+UPLOAD_LIMIT = 16 * 1024 * 1024
+
+
+async def _chunks(data, size=1000):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _records(data, fmt):
+    async def collect():
+        return [item async for item in iter_records(_chunks(data), fmt)]
+    return asyncio.run(collect())
+
+
+def _events(body):
+    return [json.loads(line) for line in body.decode('utf-8').splitlines() if line]
+
+
+@pytest.fixture
+def client(tmp_path):
+    backend.app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    return backend.app.test_client()
+
+
+def test_csv_quoted_fields_may_span_lines():
+    data = b'name,notes\r\n"Ann","line one\r\nline two"\r\nBob,"say ""hi"""\r\n'
+    assert _records(data, 'csv') == [
+        (2, {'name': 'Ann', 'notes': 'line one\nline two'}),
+        (4, {'name': 'Bob', 'notes': 'say "hi"'}),
+    ]
+
+
+def test_csv_unterminated_quote_is_reported():
+    records = _records(b'name,notes\nAnn,"open\n', 'csv')
+    assert len(records) == 1
+    assert records[0][0] == 2 and isinstance(records[0][1], BulkFormatError)
+
+
+def test_invalid_utf8_is_a_row_error():
+    records = _records(b'{"name": "Ann"}\n{"name": "\xff"}\n{"name": "Bob"}\n', 'ndjson')
+    assert [line for line, _ in records] == [1, 2, 3]
+    assert isinstance(records[1][1], BulkFormatError)
+    assert records[2][1] == {'name': 'Bob'}
+
+
+def test_bulk_patients_streams_past_upload_limit(client):
+    line = json.dumps({'name': 'Patient', 'notes': 'x' * 200}).encode('utf-8') + b'\n'
+    count = UPLOAD_LIMIT // len(line) + 1000
+    body = line * count + b'{"name": "\xff"}\n'
+    assert len(body) > UPLOAD_LIMIT
+
+    async def run():
+        response = await client.post(
+            '/bulk/patients', data=body, headers={'Content-Type': 'application/x-ndjson'}
+        )
+        return response.status_code, await response.get_data()
+
+    status, data = asyncio.run(run())
+    assert status == 200
+    done = _events(data)[-1]
+    assert done['done'] is True
+    assert done['inserted'] == count
+    assert done['failed'] == 1 and done['errors'][0]['line'] == count + 1
+
+
+def test_bulk_reports_streams_past_upload_limit(client, tmp_path):
+    payload = b'\0' * (UPLOAD_LIMIT + 1024)
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        member = tarfile.TarInfo('p1/scan.bin')
+        member.size = len(payload)
+        tar.addfile(member, io.BytesIO(payload))
+
+    async def run():
+        response = await client.post(
+            '/bulk/reports', data=archive.getvalue(), headers={'Content-Type': 'application/x-tar'}
+        )
+        return response.status_code, await response.get_data()
+
+    status, data = asyncio.run(run())
+    assert status == 200
+    done = _events(data)[-1]
+    assert done['done'] is True
+    assert done['processed'] == 1
+    assert done['errors'] == [{'file': 'p1/scan.bin', 'error': 'Invalid file type'}]
+    # The archive is read from the body, never spooled to the upload folder
+    assert os.listdir(tmp_path) == []
+
+
+def test_single_uploads_keep_upload_limit(client):
+    async def run():
+        response = await client.post(
+            '/extract-text',
+            form={'patient_id': 'p1', 'file_category': 'lab'},
+            files={'file': FileStorage(io.BytesIO(b'x' * (UPLOAD_LIMIT + 1)), filename='scan.pdf')}
+        )
+        return response.status_code
+
+    assert asyncio.run(run()) == 413
+
+
+def test_bulk_reports_are_read_from_the_body(client, tmp_path, monkeypatch):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+        for name in ('p1/lab/a.pdf', 'p2/b.pdf'):
+            data = b'%PDF ' + name.split('/')[0].encode('utf-8')
+            member = tarfile.TarInfo(name)
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+
+    async def insert_batch(documents):
+        return 200, {'results': [{'document_id': f"id-{i}", 'duplicate': False} for i in range(len(documents))]}
+
+    monkeypatch.setattr(backend, 'extract_document_text', lambda filepath: open(filepath).read())
+    monkeypatch.setattr(backend.rag_client, 'insert_batch', insert_batch)
+    monkeypatch.setattr(backend.reports_collection, 'reports', [])
+
+    async def run():
+        response = await client.post(
+            '/bulk/reports', data=archive.getvalue(), headers={'Content-Type': 'application/x-tar'}
+        )
+        return await response.get_data()
+
+    done = _events(asyncio.run(run()))[-1]
+    assert (done['processed'], done['inserted'], done['failed']) == (2, 2, 0)
+    reports = backend.reports_collection.find('reports')
+    assert [(r['patient_id'], r['file_category'], r['rag_document_id']) for r in reports] == [
+        ('p1', 'lab', 'id-0'), ('p2', 'imported', 'id-1')
+    ]
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def rag_deletes(monkeypatch):
+    deleted = []
+
+    async def delete(document_id):
+        deleted.append(document_id)
+        return 200, {'status': 'success'}
+
+    monkeypatch.setattr(backend.rag_client, 'delete', delete)
+    monkeypatch.setattr(backend.reports_collection, 'reports', [])
+    return deleted
+
+
+def _delete(document_id):
+    async def run():
+        response = await backend.app.test_client().delete(f'/delete-document/{document_id}')
+        return response.status_code
+    return asyncio.run(run())
+
+
+def _report(**fields):
+    report = {'patient_id': 'p1', 'filename': 'scan.pdf', 'text_content': 'Hb 13 g/dL', **fields}
+    backend.reports_collection.insert_one('reports', report)
+    return report['_id']
+
+
+def test_rag_document_is_deleted_with_its_last_report(rag_deletes):
+    # Different files with the same extracted text share one RAG document
+    first = _report(file_hash='a', rag_document_id='p1|f1')
+    second = _report(file_hash='b', rag_document_id='p1|f1')
+
+    assert _delete(first) == 200
+    assert rag_deletes == []
+    assert _delete(second) == 200
+    assert rag_deletes == ['p1|f1']
+
+
+def test_duplicate_upload_inherits_text_of_deleted_original(rag_deletes):
+    original = _report(file_hash='a', rag_document_id='p1|f1')
+    duplicate = _report(file_hash='a', rag_document_id='p1|f1', duplicate_of=original, text_content=None)
+
+    assert _delete(original) == 200
+    assert rag_deletes == []
+    heir = backend.reports_collection.find_one('reports', {'_id': duplicate})
+    assert heir['duplicate_of'] is None and heir['text_content'] == 'Hb 13 g/dL'
+
+
+def test_report_without_rag_document_is_deleted_locally(rag_deletes):
+    report = _report(file_hash='a')
+
+    assert _delete(report) == 200
+    assert rag_deletes == []
+    assert backend.reports_collection.find_one('reports', {'_id': report}) is None
@@ -0,0 +1,71 @@
+import os
+import asyncio
+import time
+
+import tracing
+from tracing import SlowRequestProfiler, run_in_thread
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def stacks(samples, name):
+    return sum(count for stack, count in samples.items() if name in stack)
+
+
+def test_profiles_are_attributed_per_request(monkeypatch):
+    monkeypatch.setattr(tracing, 'profiler', SlowRequestProfiler(interval=0.002))
+
+    async def request(work):
+        session_id = tracing.profiler.start()
+        with tracing.profiling(session_id):
+            await work()
+        return tracing.profiler.stop(session_id)
+
+    async def in_thread():
+        await run_in_thread(busy, 0.2)
+
+    async def idle():
+        await asyncio.sleep(0.2)
+
+    async def main():
+        return await asyncio.gather(request(in_thread), request(idle))
+
+    threaded, idle_samples = asyncio.run(main())
+    assert stacks(threaded, 'busy') > 10
+    # Time the loop spends waiting is not sampled, nor is the other request's thread
+    assert stacks(idle_samples, 'busy') == 0
+    assert sum(idle_samples.values()) < 10
+
+
+def test_streamed_response_closes_span_after_body(monkeypatch):
+    from app import app, patients_collection
+
+    # Record whether the streamed import had run when the span was closed
+    finished = []
+    monkeypatch.setattr('app.finish_request', lambda state, **attributes: finished.append(
+        (attributes, len(patients_collection.find('patients', {'name': 'streamed'})))
+    ))
+
+    async def main():
+        client = app.test_client()
+        response = await client.post(
+            '/bulk/patients', data=b'{"name": "streamed"}\n', headers={'Content-Type': 'application/x-ndjson'}
+        )
+        assert response.status_code == 200
+        await response.get_data()
+
+    asyncio.run(main())
+    assert finished == [({'status': 200}, 1)]
+
+
+def test_backend_and_rag_share_one_tracing_module():
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(backend_dir, "tracing.py"), 'rb') as f:
+        backend_tracing = f.read()
+    with open(os.path.join(os.path.dirname(backend_dir), "rag", "tracing.py"), 'rb') as f:
+        rag_tracing = f.read()
+    assert backend_tracing == rag_tracing, "backend/tracing.py and rag/tracing.py have diverged"
@@ -5,17 +5,19 @@ import logging
 import PyPDF2
 from dataclasses import dataclass, asdict
 import json
+import hashlib
 import fitz
 import requests
 from PIL import Image
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
+from ocr import ocr_pdf_pages, ocr_image_file
 
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
 # File upload configuration
@@ -41,6 +43,9 @@ class InMemoryDB:
             
         return document
 
+    def insert_many(self, collection: str, documents: List[Dict]) -> List[Dict]:
+        return [self.insert_one(collection, document) for document in documents]
+
     def find_one(self, collection: str, query: Dict) -> Dict:
         target_list = self.patients if collection == 'patients' else self.reports
         for doc in target_list:
@@ -58,6 +63,14 @@ class InMemoryDB:
             if all(doc.get(k) == v for k, v in query.items())
         ]
 
+    def update_one(self, collection: str, query: Dict, values: Dict) -> bool:
+        """Set fields on the first document matching the query"""
+        doc = self.find_one(collection, query)
+        if doc is None:
+            return False
+        doc.update(values)
+        return True
+
     def delete_one(self, collection: str, query: Dict) -> bool:
         """Delete a single document from the collection"""
         target_list = self.patients if collection == 'patients' else self.reports
@@ -92,6 +105,14 @@ def allowed_file(filename: str) -> bool:
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def file_sha256(filepath: str, chunk_size: int = 65536) -> str:
+    """Compute the SHA-256 hex digest of a file on disk"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def process_pdf(filepath: str) -> str:
     """Extract text from PDF file"""
     try:
@@ -105,16 +126,25 @@ def process_pdf(filepath: str) -> str:
             logger.error("Failed to open PDF document")
             return ""
             
-        text = []
+        pages = {}
+        image_only_pages = []
         for page_num in range(len(pdf_document)):
             page = pdf_document.load_page(page_num)
             if page:
                 page_text = page.get_text()
-                if page_text:
-                    text.append(page_text)
+                if page_text.strip():
+                    pages[page_num] = page_text
+                else:
+                    image_only_pages.append(page_num)
+
+        # OCR only the pages without a text layer
+        if image_only_pages:
+            logger.info(f"{len(image_only_pages)} page(s) have no text layer, running OCR")
+            pages.update(ocr_pdf_pages(pdf_document, image_only_pages, file_sha256(filepath)))
                     
         pdf_document.close()
         
+        text = [pages[page_num] for page_num in sorted(pages) if pages[page_num].strip()]
         result = '\n\n'.join(text)
         logger.info(f"Successfully extracted {len(result)} characters from PDF")
         return result
@@ -123,6 +153,28 @@ def process_pdf(filepath: str) -> str:
         logger.error(f"Error processing PDF: {str(e)}")
         return ""
 
+def process_image(filepath: str) -> str:
+    """Extract text from an image file using OCR"""
+    try:
+        logger.info(f"Processing image file: {filepath}")
+        if not os.path.exists(filepath):
+            logger.error(f"File not found: {filepath}")
+            return ""
+
+        result = ocr_image_file(filepath).strip()
+        logger.info(f"Successfully extracted {len(result)} characters from image")
+        return result
+
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}")
+        return ""
+
+def extract_document_text(filepath: str) -> str:
+    """Extract text from an uploaded PDF or image file"""
+    if filepath.lower().endswith('.pdf'):
+        return process_pdf(filepath)
+    return process_image(filepath)
+
 def ask_llm(raw_text):
     """Process text using Together AI API"""
     try:
@@ -60,6 +60,24 @@ export default function AdminDashboard() {
     }
   };
 
+  const waitForJob = async (jobId) => {
+    // Poll the ingestion job until it finishes
+    while (true) {
+      const response = await fetch(`http://127.0.0.1:5000/jobs/${jobId}`);
+      if (!response.ok) {
+        throw new Error("Failed to fetch upload status");
+      }
+      const job = await response.json();
+      if (job.status === 'completed') {
+        return job;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Failed to process file');
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleFileUpload = async (e) => {
     e.preventDefault();
     if (!file || !selectedPatient || !fileCategory) {
@@ -82,6 +100,11 @@ export default function AdminDashboard() {
         throw new Error(errorData.error || 'Failed to upload file');
       }
 
+      // Duplicate uploads are resolved immediately and have no job to wait on
+      const { job_id } = await response.json();
+      if (job_id) {
+        await waitForJob(job_id);
+      }
       await fetchPatientDocuments();
       
       setUploadSuccess(true);
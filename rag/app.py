@@ -10,8 +10,9 @@ import pinecone
 from langchain.embeddings import AzureOpenAIEmbeddings
 from langchain.chat_models import AzureChatOpenAI
 from langchain.vectorstores import Pinecone
-from langchain.chains import ConversationalRetrievalQA
-from langchain.memory import ConversationBufferMemory
+from langchain.chains import ConversationalRetrievalChain
+from langchain.memory import ConversationTokenBufferMemory, ConversationSummaryBufferMemory
+from sessions import SessionMemoryStore
 
 # Load environment variables
 load_dotenv()
@@ -59,18 +60,28 @@ llm = AzureChatOpenAI(
     temperature=0
 )
 
-# Initialize conversation memory
-memory = ConversationBufferMemory(
-    memory_key="chat_history",
-    return_messages=True
-)
-
-# Initialize QA chain
-qa = ConversationalRetrievalQA.from_llm(
-    llm=llm,
-    retriever=vectorstore.as_retriever(),
-    memory=memory,
-    verbose=True
+# Conversation memory is kept per session and bounded: "window" keeps the
+# most recent turns that fit in MEMORY_MAX_TOKENS, "summary" folds older
+# turns into a running summary instead of dropping them
+MEMORY_MODE = os.getenv("MEMORY_MODE", "window")
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "1000"))
+
+def create_memory():
+    """Create a token-bounded conversation memory for a new session"""
+    memory_class = ConversationSummaryBufferMemory if MEMORY_MODE == "summary" else ConversationTokenBufferMemory
+    return memory_class(
+        llm=llm,
+        max_token_limit=MEMORY_MAX_TOKENS,
+        memory_key="chat_history",
+        output_key="answer",
+        return_messages=True
+    )
+
+sessions = SessionMemoryStore(
+    create_memory,
+    max_sessions=int(os.getenv("MAX_SESSIONS", "1000")),
+    idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", "1800")),
+    max_total_chars=int(os.getenv("SESSION_MEMORY_MAX_CHARS", "20000000"))
 )
 
 class Document(BaseModel):
@@ -80,6 +91,7 @@ class Document(BaseModel):
 class Query(BaseModel):
     query: str
     patient_id: Optional[str] = None
+    session_id: Optional[str] = None
 
 class DeleteRequest(BaseModel):
     document_id: str
@@ -131,21 +143,42 @@ async def query_documents(query: Query):
         if query.patient_id:
             filter_dict["patient_id"] = query.patient_id
             
-        # Get response from QA chain
-        response = qa(
-            {"question": query.query},
-            filter=filter_dict if filter_dict else None
+        # Each session gets its own bounded history. One-off queries without
+        # a session get a throwaway memory that is never stored
+        session_id = query.session_id
+        memory = sessions.get(session_id) if session_id else create_memory()
+
+        qa = ConversationalRetrievalChain.from_llm(
+            llm=llm,
+            retriever=vectorstore.as_retriever(
+                search_kwargs={"filter": filter_dict} if filter_dict else {}
+            ),
+            memory=memory,
+            verbose=True
         )
+
+        # Get response from QA chain
+        response = qa({"question": query.query})
+        if session_id:
+            sessions.update(session_id)
         
         logger.info("Query processed successfully")
         return {
             "answer": response["answer"],
-            "source_documents": response.get("source_documents", [])
+            "source_documents": response.get("source_documents", []),
+            "session_id": session_id
         }
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete("/session/{session_id}")
+async def clear_session(session_id: str):
+    """Forget a conversation session"""
+    if not sessions.clear(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"message": "Session cleared"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8080)
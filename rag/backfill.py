@@ -0,0 +1,25 @@
+"""Backfill structured facts and report summaries for the live index.
+
+Documents indexed before fact extraction and summaries were added, and
+generations rebuilt by reindex.py, have neither until this is run:
+
+    python backfill.py
+"""
+import asyncio
+import logging
+
+from rag import backfill_documents
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    counts = asyncio.run(backfill_documents())
+    logger.info(
+        f"Backfilled {counts['facts']} fact extraction(s) and {counts['summaries']} summary(ies) "
+        f"across {counts['documents']} document(s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
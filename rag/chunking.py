@@ -0,0 +1,57 @@
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# Vector metadata for chunked documents: every chunk carries the document's
+# fingerprint as "document" and its position as "chunk"; only chunk 0 carries
+# "fingerprint", so duplicate detection sees one entry per document.
+CHUNK_FIELDS = ('document', 'chunk')
+
+
+def chunk_text(text: str, chunk_size: int = 0, chunk_overlap: int = 0) -> List[str]:
+    """Split text into overlapping character windows (chunk_size 0 keeps it whole)"""
+    if chunk_size <= 0 or len(text) <= chunk_size:
+        return [text]
+    step = max(1, chunk_size - chunk_overlap)
+    chunks = []
+    for start in range(0, len(text), step):
+        chunks.append(text[start:start + chunk_size])
+        if start + chunk_size >= len(text):
+            break
+    return chunks
+
+
+def chunk_metadata(metadata: Dict[str, Any], chunks: List[str]) -> List[Dict[str, Any]]:
+    """Per-chunk vector metadata for a document whose metadata has a fingerprint"""
+    fingerprint = metadata.get('fingerprint')
+    entries = []
+    for i, chunk in enumerate(chunks):
+        entry = {k: v for k, v in metadata.items() if k != 'fingerprint' or i == 0}
+        entry.update(text=chunk, document=fingerprint, chunk=i)
+        entries.append(entry)
+    return entries
+
+
+def iter_documents(entries: Iterable[Dict[str, Any]], chunk_overlap: int = 0) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """Reassemble whole documents from consecutive vector metadata entries.
+
+    Yields (metadata with the full text, number of entries consumed).
+    Deleted documents are skipped; their entries count towards the next
+    document yielded.
+    """
+    current = None
+    consumed = 0
+    skipped = 0
+    for entry in entries:
+        if entry.get('chunk', 0) == 0:
+            if current is not None:
+                if current.get('deleted'):
+                    skipped += consumed
+                else:
+                    yield current, consumed + skipped
+                    skipped = 0
+            current = {k: v for k, v in entry.items() if k not in CHUNK_FIELDS}
+            consumed = 1
+        else:
+            current['text'] += entry['text'][chunk_overlap:]
+            consumed += 1
+    if current is not None and not current.get('deleted'):
+        yield current, consumed + skipped
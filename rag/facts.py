@@ -0,0 +1,575 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Structured facts live next to the vector index; SQLite lets every worker
+# process read them concurrently while writes are serialised by the database.
+FACTS_DB_PATH = os.getenv(
+    "FACTS_DB_PATH", os.path.join(os.getenv("VECTOR_STORE_DIR", "vector_store"), "facts.db")
+)
+MAX_LISTED_PATIENTS = 25
+
+# Lab name -> aliases, canonical unit, reference range (used for "elevated"/"low")
+# and conversions from other units (lower case, no spaces) to the canonical one
+LABS = {
+    'hba1c': {
+        'label': 'HbA1c', 'unit': '%', 'low': 4.0, 'high': 6.4,
+        'aliases': [r'hb\s*a1c', r'h(?:a)?emoglobin\s*a1c', r'a1c', r'glyc(?:at|osyl)ated\s+h(?:a)?emoglobin'],
+        'convert': {'mmol/mol': lambda v: 0.09148 * v + 2.152},  # IFCC -> NGSP
+    },
+    'glucose': {
+        'label': 'Glucose', 'unit': 'mg/dL', 'low': 70, 'high': 99,
+        'aliases': [r'(?:fasting\s+)?(?:blood|plasma|serum)?\s*glucose', r'\bfbs\b', r'blood\s+sugar'],
+        'convert': {'mmol/l': lambda v: v * 18.016},
+    },
+    'ldl': {
+        'label': 'LDL cholesterol', 'unit': 'mg/dL', 'low': 0, 'high': 129,
+        'aliases': [r'\bldl(?:[\s-]*c(?:holesterol)?)?\b'],
+        'convert': {'mmol/l': lambda v: v * 38.67},
+    },
+    'hdl': {
+        'label': 'HDL cholesterol', 'unit': 'mg/dL', 'low': 40, 'high': 200,
+        'aliases': [r'\bhdl(?:[\s-]*c(?:holesterol)?)?\b'],
+        'convert': {'mmol/l': lambda v: v * 38.67},
+    },
+    'total_cholesterol': {
+        'label': 'Total cholesterol', 'unit': 'mg/dL', 'low': 0, 'high': 199,
+        'aliases': [r'total\s+cholesterol', r'(?<!ldl\s)(?<!hdl\s)\bcholesterol\b'],
+        'convert': {'mmol/l': lambda v: v * 38.67},
+    },
+    'triglycerides': {
+        'label': 'Triglycerides', 'unit': 'mg/dL', 'low': 0, 'high': 149,
+        'aliases': [r'triglycerides?', r'\btg\b'],
+        'convert': {'mmol/l': lambda v: v * 88.57},
+    },
+    'creatinine': {
+        'label': 'Creatinine', 'unit': 'mg/dL', 'low': 0.6, 'high': 1.3,
+        'aliases': [r'(?:serum\s+)?creatinine'],
+        'convert': {'umol/l': lambda v: v / 88.4, 'µmol/l': lambda v: v / 88.4},
+    },
+    'egfr': {
+        'label': 'eGFR', 'unit': 'mL/min/1.73m2', 'low': 60, 'high': 200,
+        'aliases': [r'\be?gfr\b'],
+        'convert': {'ml/min': lambda v: v},
+    },
+    'hemoglobin': {
+        'label': 'Hemoglobin', 'unit': 'g/dL', 'low': 12.0, 'high': 17.5,
+        'aliases': [r'h(?:a)?emoglobin(?!\s*a1c)', r'\bhgb\b', r'\bhb\b(?!\s*a1c)'],
+        'convert': {'g/l': lambda v: v / 10},
+    },
+    'tsh': {
+        'label': 'TSH', 'unit': 'mIU/L', 'low': 0.4, 'high': 4.0,
+        'aliases': [r'\btsh\b', r'thyroid[\s-]+stimulating\s+hormone'],
+        'convert': {'uiu/ml': lambda v: v, 'µiu/ml': lambda v: v},
+    },
+}
+
+# Diagnosis keyword -> (ICD-10 code, label)
+DIAGNOSES = {
+    r'(?:type\s*2\s+)?diabet(?:es|ic)(?:\s+mellitus)?': ('E11', 'Diabetes mellitus'),
+    r'hypertensi(?:on|ve)|high\s+blood\s+pressure': ('I10', 'Hypertension'),
+    r'hyperlipid(?:a)?emia|dyslipid(?:a)?emia': ('E78', 'Hyperlipidemia'),
+    r'hypothyroid(?:ism)?': ('E03', 'Hypothyroidism'),
+    r'chronic\s+kidney\s+disease|\bckd\b': ('N18', 'Chronic kidney disease'),
+    r'an(?:a)?emi(?:a|c)': ('D64', 'Anemia'),
+    r'asthma(?:tic)?': ('J45', 'Asthma'),
+    r'coronary\s+artery\s+disease|\bcad\b': ('I25', 'Coronary artery disease'),
+}
+
+# Codes that a diagnosis filter in a question also matches (by prefix)
+DIAGNOSIS_CODE_FAMILIES = {
+    'E11': ('E10', 'E11', 'E13'),
+    'I10': ('I10', 'I11', 'I12', 'I13', 'I15'),
+}
+
+DIAGNOSES_LABELS = {code: label for code, label in DIAGNOSES.values()}
+
+NUMBER = r'(\d+(?:\.\d+)?)'
+UNIT = r'(%|mg/dl|mmol/mol|mmol/l|[uµ]mol/l|g/dl|g/l|miu/l|[uµ]iu/ml|ml/min(?:/1\.73\s*m(?:2|²))?)?'
+ICD_CODE = re.compile(r'\b([A-TV-Z][0-9][0-9AB](?:\.[0-9A-TV-Z]{1,4})?)\b')
+NEGATION = re.compile(r'\b(?:no|denies|negative\s+for|without|ruled\s+out|r/o)\s+(?:\w+\s+){0,2}$', re.IGNORECASE)
+
+MONTHS = {m: i for i, m in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1)}
+DATE_PATTERNS = [
+    (re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b'), lambda m: (int(m[1]), int(m[2]), int(m[3]))),
+    (re.compile(r'\b(\d{1,2})/(\d{1,2})/(\d{4})\b'), lambda m: (int(m[3]), int(m[1]), int(m[2]))),
+    (re.compile(r'\b([a-z]{3})[a-z]*\.?\s+(\d{1,2}),?\s+(\d{4})\b', re.IGNORECASE),
+     lambda m: (int(m[3]), MONTHS.get(m[1].lower(), 0), int(m[2]))),
+    (re.compile(r'\b(\d{1,2})\s+([a-z]{3})[a-z]*\.?\s+(\d{4})\b', re.IGNORECASE),
+     lambda m: (int(m[3]), MONTHS.get(m[2].lower(), 0), int(m[1]))),
+]
+REPORT_DATE_LINE = re.compile(r'date|collected|reported|sampled|received', re.IGNORECASE)
+BIRTH_DATE_LINE = re.compile(r'birth|\bdob\b', re.IGNORECASE)
+
+
+def _to_date(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        # 03/04/2024 may be day-first
+        try:
+            return date(year, day, month)
+        except ValueError:
+            return None
+
+
+def parse_date(text: str) -> Optional[date]:
+    """Parse the first recognisable date in a string"""
+    for pattern, parts in DATE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            parsed = _to_date(*parts(match))
+            if parsed:
+                return parsed
+    return None
+
+
+def report_date(text: str, fallback: Optional[str] = None) -> str:
+    """Best guess at the date a report refers to, as YYYY-MM-DD"""
+    for line in text.splitlines():
+        if REPORT_DATE_LINE.search(line) and not BIRTH_DATE_LINE.search(line):
+            parsed = parse_date(line)
+            if parsed:
+                return parsed.isoformat()
+    if fallback:
+        try:
+            return datetime.fromisoformat(fallback).date().isoformat()
+        except ValueError:
+            pass
+    return date.today().isoformat()
+
+
+# A lab's value follows its name on the same line, at most this many
+# characters later (not counting reference ranges skipped on the way)
+MAX_VALUE_GAP = 25
+VALUE_WINDOW = 120
+# A "<"/">" qualifier ("TSH <0.01", "eGFR >90") marks a bound, not a measured value
+_VALUE = re.compile(rf'(?:([<>≤≥])\s*)?(?<![\d.]){NUMBER}\s*{UNIT}(?![\w/])', re.IGNORECASE)
+# Reference ranges, bracketed notes and other number ranges are never the result
+_NOT_A_VALUE = re.compile(
+    r'\([^)\n]*\)|\[[^\]\n]*\]'
+    r'|(?:ref(?:erence)?|normal|range|target|goal)\b[^\d\n]{0,15}[<>≤≥]?\s*\d+(?:\.\d+)?'
+    r'(?:\s*(?:-|–|to)\s*\d+(?:\.\d+)?)?'
+    r'|\d+(?:\.\d+)?\s*(?:-|–)\s*\d+(?:\.\d+)?',
+    re.IGNORECASE
+)
+# A unit we don't recognise straight after a value ("12 ng/mL")
+_OTHER_UNIT = re.compile(r'[^\S\n]*([a-zµ]+/[a-z0-9.]+)', re.IGNORECASE)
+_LAB_NAME_PATTERNS = [
+    (lab, re.compile(rf'(?:{"|".join(spec["aliases"])})', re.IGNORECASE))
+    for lab, spec in LABS.items()
+]
+_DIAGNOSIS_PATTERNS = [(re.compile(pattern, re.IGNORECASE), code) for pattern, code in DIAGNOSES.items()]
+
+
+def _canonical_value(lab: str, value: float, unit: Optional[str]) -> Optional[float]:
+    """Convert a value to the lab's canonical unit; None for units we can't convert"""
+    spec = LABS[lab]
+    unit = re.sub(r'\s+', '', (unit or '').lower()).replace('²', '2')
+    if not unit or unit == re.sub(r'\s+', '', spec['unit'].lower()):
+        return value
+    convert = spec.get('convert', {}).get(unit)
+    return convert(value) if convert else None
+
+
+def _lab_value(text: str, start: int) -> Optional[Tuple[float, Optional[str], int, Optional[str]]]:
+    """Find the result after a lab name ending at `start`: (value, unit, end offset, comparator)"""
+    line_end = text.find('\n', start)
+    window = text[start:line_end if line_end != -1 else len(text)][:VALUE_WINDOW]
+    # Blank out reference ranges with a marker that does not count towards the gap
+    masked = _NOT_A_VALUE.sub(lambda m: '\0' * len(m.group()), window)
+    match = _VALUE.search(masked)
+    if not match or len(masked[:match.start()].replace('\0', '')) > MAX_VALUE_GAP:
+        return None
+    comparator, value, unit = match.groups()
+    if unit is None:
+        other = _OTHER_UNIT.match(masked, match.end())
+        if other:
+            return float(value), other.group(1), start + other.end(), comparator
+    return float(value), unit, start + match.end(), comparator
+
+
+def extract_facts(text: str, metadata: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Pull lab results and diagnoses out of extracted report text"""
+    fact_date = report_date(text, metadata.get('upload_date'))
+    labs = []
+    claimed = []  # character spans already attributed to a lab
+
+    for lab, pattern in _LAB_NAME_PATTERNS:
+        for match in pattern.finditer(text):
+            found = _lab_value(text, match.end())
+            if found is None:
+                continue
+            value, unit, end, comparator = found
+            if any(start < end and match.start() < stop for start, stop in claimed):
+                continue
+            claimed.append((match.start(), end))
+            if comparator:
+                # Only exact values can answer threshold and average queries
+                logger.debug(f"Skipping {lab} value qualified by {comparator}")
+                continue
+            value = _canonical_value(lab, value, unit)
+            if value is None:
+                logger.debug(f"Skipping {lab} value in unsupported unit {unit}")
+                continue
+            labs.append({
+                'lab': lab,
+                'value': round(value, 2),
+                'unit': LABS[lab]['unit'],
+                'date': fact_date
+            })
+
+    diagnoses = {}
+    for pattern, (code, label) in _DIAGNOSIS_PATTERNS:
+        for match in pattern.finditer(text):
+            if NEGATION.search(text[max(0, match.start() - 40):match.start()]):
+                continue
+            diagnoses[code] = {'code': code, 'label': label, 'date': fact_date}
+            break
+    for line in text.splitlines():
+        if re.search(r'icd|diagnos', line, re.IGNORECASE):
+            for code in ICD_CODE.findall(line):
+                diagnoses.setdefault(code, {'code': code, 'label': code, 'date': fact_date})
+
+    return {'labs': labs, 'diagnoses': list(diagnoses.values())}
+
+
+class FactStore:
+    """Indexed store of structured lab results and diagnoses"""
+
+    def __init__(self, path: str = FACTS_DB_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS lab_results (
+                    document TEXT NOT NULL,
+                    patient_id TEXT,
+                    lab TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    unit TEXT,
+                    date TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_lab_date_value ON lab_results (lab, date, value);
+                CREATE INDEX IF NOT EXISTS idx_lab_patient ON lab_results (patient_id, lab, date);
+                CREATE INDEX IF NOT EXISTS idx_lab_document_patient ON lab_results (document, patient_id);
+                CREATE TABLE IF NOT EXISTS diagnoses (
+                    document TEXT NOT NULL,
+                    patient_id TEXT,
+                    code TEXT NOT NULL,
+                    label TEXT,
+                    date TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_diagnosis_code ON diagnoses (code, patient_id);
+                CREATE INDEX IF NOT EXISTS idx_diagnosis_document_patient ON diagnoses (document, patient_id);
+                CREATE TABLE IF NOT EXISTS fact_documents (
+                    document TEXT NOT NULL,
+                    patient_id TEXT
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_fact_documents ON fact_documents (document, patient_id);
+                DROP INDEX IF EXISTS idx_lab_document;
+                DROP INDEX IF EXISTS idx_diagnosis_document;
+            """)
+
+    def add_document(self, document: str, text: str, metadata: Dict[str, Any]) -> int:
+        """Extract and store facts for one document, replacing any earlier facts for it.
+
+        The same text can be uploaded for several patients, so rows are keyed
+        by (patient_id, document) rather than by the content fingerprint alone.
+        """
+        facts = extract_facts(text, metadata)
+        patient_id = metadata.get('patient_id')
+        key = (document, patient_id)
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM lab_results WHERE document = ? AND patient_id IS ?", key)
+            self.conn.execute("DELETE FROM diagnoses WHERE document = ? AND patient_id IS ?", key)
+            self.conn.execute("DELETE FROM fact_documents WHERE document = ? AND patient_id IS ?", key)
+            self.conn.execute("INSERT INTO fact_documents (document, patient_id) VALUES (?, ?)", key)
+            self.conn.executemany(
+                "INSERT INTO lab_results (document, patient_id, lab, value, unit, date) VALUES (?, ?, ?, ?, ?, ?)",
+                [(document, patient_id, f['lab'], f['value'], f['unit'], f['date']) for f in facts['labs']]
+            )
+            self.conn.executemany(
+                "INSERT INTO diagnoses (document, patient_id, code, label, date) VALUES (?, ?, ?, ?, ?)",
+                [(document, patient_id, f['code'], f['label'], f['date']) for f in facts['diagnoses']]
+            )
+        return len(facts['labs']) + len(facts['diagnoses'])
+
+    def delete_document(self, document: str, patient_id: Optional[str]):
+        """Remove the facts of one document for one patient"""
+        key = (document, patient_id)
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM lab_results WHERE document = ? AND patient_id IS ?", key)
+            self.conn.execute("DELETE FROM diagnoses WHERE document = ? AND patient_id IS ?", key)
+            self.conn.execute("DELETE FROM fact_documents WHERE document = ? AND patient_id IS ?", key)
+
+    def has_document(self, document: str, patient_id: Optional[str]) -> bool:
+        """Whether facts have been extracted for this document and patient"""
+        rows = self.query(
+            "SELECT 1 FROM fact_documents WHERE document = ? AND patient_id IS ?", (document, patient_id)
+        )
+        return bool(rows)
+
+    def query(self, sql: str, params: Tuple) -> List[Tuple]:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+
+@dataclass
+class StructuredQuery:
+    lab: Optional[str] = None
+    op: Optional[str] = None
+    threshold: Optional[float] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+    diagnoses: List[str] = field(default_factory=list)
+    aggregate: Optional[str] = None
+    listing: bool = False
+
+
+def _date_range(question: str) -> Tuple[Optional[str], Optional[str]]:
+    """Extract a [start, end) date range from a question"""
+    q = question.lower()
+    match = re.search(r'\bq([1-4])\s*(?:of\s+)?(\d{4})\b', q)
+    if match:
+        quarter, year = int(match[1]), int(match[2])
+        start = date(year, 3 * quarter - 2, 1)
+        end = date(year + 1, 1, 1) if quarter == 4 else date(year, 3 * quarter + 1, 1)
+        return start.isoformat(), end.isoformat()
+    match = re.search(r'\blast\s+(\d+)\s+(day|week|month|year)s?\b', q)
+    if match:
+        days = int(match[1]) * {'day': 1, 'week': 7, 'month': 30, 'year': 365}[match[2]]
+        return (date.today() - timedelta(days=days)).isoformat(), None
+    match = re.search(r'\bbetween\s+(.+?)\s+and\s+(.+?)(?:$|[?.,])', q)
+    if match:
+        start, end = parse_date(match[1]), parse_date(match[2])
+        if start and end:
+            return start.isoformat(), (end + timedelta(days=1)).isoformat()
+    match = re.search(r'\b(?:since|after|from)\s+(.+?)(?:$|[?.,])', q)
+    if match and parse_date(match[1]):
+        return parse_date(match[1]).isoformat(), None
+    match = re.search(r'\bbefore\s+(.+?)(?:$|[?.,])', q)
+    if match and parse_date(match[1]):
+        return None, parse_date(match[1]).isoformat()
+    match = re.search(r'\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+(\d{4})\b', q)
+    if match:
+        year, month = int(match[2]), MONTHS[match[1]]
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        return date(year, month, 1).isoformat(), end.isoformat()
+    match = re.search(r'\b(?:in|during|for)\s+(\d{4})\b', q)
+    if match:
+        year = int(match[1])
+        return date(year, 1, 1).isoformat(), date(year + 1, 1, 1).isoformat()
+    return None, None
+
+
+# Questions about what was said or why go to free-text retrieval even when
+# they mention a lab or a diagnosis
+NARRATIVE = re.compile(
+    r'\b(?:say|says|said|mention(?:s|ed)?|note[sd]?|recommend(?:s|ed)?|advi[sc]e[sd]?|told|why|explain|'
+    r'describe[sd]?|discuss(?:es|ed)?|think|plan|medications?|treatment|prescribed)\b'
+)
+# Asking for a list or count of patients rather than about one patient
+PATIENT_LISTING = re.compile(
+    r'\b(?:which|what|list|show|find|all|any|how\s+many|number\s+of|count)\s+(?:\w+\s+){0,2}?patients\b'
+    r'|\bwho\s+(?:has|have|had|is|are|was|were)\b'
+    r'|\bpatients?\s+(?:with|who|whose|that|having|diagnosed)\b'
+)
+LATEST = re.compile(r'\b(?:latest|most\s+recent|current|last)\b(?!\s+\d)')
+LAB_VALUE_WORDS = re.compile(r'\b(?:levels?|values?|results?|readings?|measurements?)\b')
+
+
+def parse_structured_query(question: str) -> Optional[StructuredQuery]:
+    """Recognise threshold, date-range and aggregate questions about labs and diagnoses.
+
+    Returns None when the question needs free-text retrieval instead: only
+    questions with a clear filter or aggregate over stored facts qualify.
+    """
+    q = question.lower()
+    if NARRATIVE.search(q):
+        return None
+    parsed = StructuredQuery()
+
+    lab_match = None
+    for lab, pattern in _LAB_NAME_PATTERNS:
+        lab_match = pattern.search(q)
+        if lab_match:
+            parsed.lab = lab
+            break
+
+    for pattern, (code, _) in _DIAGNOSIS_PATTERNS:
+        if pattern.search(q):
+            parsed.diagnoses.append(code)
+
+    if re.search(r'\b(?:average|mean|avg)\b', q):
+        parsed.aggregate = 'avg'
+    elif re.search(r'\b(?:highest|maximum|max|peak)\b', q):
+        parsed.aggregate = 'max'
+    elif re.search(r'\b(?:lowest|minimum|min)\b', q):
+        parsed.aggregate = 'min'
+    elif re.search(r'\b(?:how\s+many|count|number\s+of)\b', q):
+        parsed.aggregate = 'count'
+    elif parsed.lab and LATEST.search(q):
+        # "latest HbA1c" or "current hemoglobin level", not "at the last visit"
+        latest = LATEST.search(q)
+        if LAB_VALUE_WORDS.search(q) or 0 <= lab_match.start() - latest.end() <= 2:
+            parsed.aggregate = 'latest'
+
+    if parsed.lab:
+        # Thresholds qualify the lab, so only look after its name
+        after = q[lab_match.end():]
+        for op, words in (
+            ('>=', r'>=|at\s+least|no\s+less\s+than'),
+            ('<=', r'<=|at\s+most|no\s+more\s+than'),
+            ('>', r'>|above|over|greater\s+than|more\s+than|higher\s+than|exceeding'),
+            ('<', r'<|below|under|less\s+than|lower\s+than'),
+        ):
+            match = re.search(rf'(?:{words})\s*{NUMBER}', after)
+            if match:
+                parsed.op, parsed.threshold = op, float(match[1])
+                break
+        if parsed.op is None:
+            if re.search(r'\b(?:elevated|high|raised|abnormal|uncontrolled|poorly\s+controlled)\b', q):
+                parsed.op, parsed.threshold = '>', LABS[parsed.lab]['high']
+            elif re.search(r'\b(?:low|decreased|reduced)\b', q):
+                parsed.op, parsed.threshold = '<', LABS[parsed.lab]['low']
+
+    parsed.start, parsed.end = _date_range(question)
+    parsed.listing = bool(PATIENT_LISTING.search(q))
+
+    if parsed.lab and (parsed.op or parsed.aggregate or parsed.start or parsed.end):
+        return parsed
+    if parsed.diagnoses and parsed.listing:
+        return parsed
+    return None
+
+
+def _diagnosis_clause(codes: List[str]) -> Tuple[str, List[Any]]:
+    prefixes = [prefix for code in codes for prefix in DIAGNOSIS_CODE_FAMILIES.get(code, (code,))]
+    clause = " OR ".join("code LIKE ?" for _ in prefixes)
+    return f"patient_id IN (SELECT patient_id FROM diagnoses WHERE {clause})", [f"{p}%" for p in prefixes]
+
+
+def _format_value(value: float, unit: Optional[str]) -> str:
+    value = f"{round(value, 2):g}"
+    return f"{value}{unit}" if unit == '%' else f"{value} {unit or ''}".strip()
+
+
+def _describe(parsed: StructuredQuery) -> str:
+    parts = []
+    if parsed.diagnoses:
+        parts.append(" or ".join(DIAGNOSES_LABELS.get(code, code) for code in parsed.diagnoses))
+    if parsed.lab:
+        condition = f" {parsed.op} {parsed.threshold:g}" if parsed.op else ""
+        parts.append(f"{LABS[parsed.lab]['label']}{condition}")
+    if parsed.start or parsed.end:
+        parts.append(f"between {parsed.start or 'the beginning'} and {parsed.end or 'today'}")
+    return ", ".join(parts)
+
+
+def answer_structured(store: FactStore, parsed: StructuredQuery, patient_id: Optional[str] = None) -> Optional[str]:
+    """Answer a parsed structured question directly from the fact index.
+
+    Returns None when no stored facts match, so the caller falls back to
+    retrieval (documents indexed before fact extraction have no rows).
+    """
+    where, params = [], []
+    if parsed.lab:
+        where.append("lab = ?")
+        params.append(parsed.lab)
+        if parsed.op:
+            where.append(f"value {parsed.op} ?")
+            params.append(parsed.threshold)
+        if parsed.start:
+            where.append("date >= ?")
+            params.append(parsed.start)
+        if parsed.end:
+            where.append("date < ?")
+            params.append(parsed.end)
+    if patient_id:
+        where.append("patient_id = ?")
+        params.append(patient_id)
+    if parsed.diagnoses and parsed.lab:
+        clause, clause_params = _diagnosis_clause(parsed.diagnoses)
+        where.append(clause)
+        params.extend(clause_params)
+    description = _describe(parsed)
+
+    # Diagnosis-only questions
+    if not parsed.lab:
+        clause, clause_params = _diagnosis_clause(parsed.diagnoses)
+        patient_filter = " AND patient_id = ?" if patient_id else ""
+        rows = store.query(
+            f"SELECT patient_id, MIN(date) FROM diagnoses WHERE ({clause}){patient_filter} "
+            f"GROUP BY patient_id ORDER BY patient_id",
+            tuple(clause_params + ([patient_id] if patient_id else []))
+        )
+        if not rows:
+            return None
+        if parsed.aggregate == 'count':
+            return f"{len(rows)} patient(s) with {description}."
+        listed = ", ".join(f"patient {pid} (since {first})" for pid, first in rows[:MAX_LISTED_PATIENTS])
+        more = f" and {len(rows) - MAX_LISTED_PATIENTS} more" if len(rows) > MAX_LISTED_PATIENTS else ""
+        return f"{len(rows)} patient(s) with {description}: {listed}{more}."
+
+    condition = " AND ".join(where)
+    label = LABS[parsed.lab]['label']
+
+    if parsed.aggregate in ('avg', 'min', 'max'):
+        rows = store.query(
+            f"SELECT {parsed.aggregate.upper()}(value), COUNT(*), MAX(unit) FROM lab_results WHERE {condition}",
+            tuple(params)
+        )
+        value, count, unit = rows[0]
+        if not count:
+            return None
+        name = {'avg': 'Average', 'min': 'Lowest', 'max': 'Highest'}[parsed.aggregate]
+        return f"{name} {label}: {_format_value(value, unit)} across {count} result(s) ({description})."
+
+    if parsed.aggregate == 'count' and not parsed.listing:
+        rows = store.query(
+            f"SELECT COUNT(DISTINCT patient_id), COUNT(*) FROM lab_results WHERE {condition}", tuple(params)
+        )
+        patients, results = rows[0]
+        if not results:
+            return None
+        return f"{patients} patient(s) with {results} result(s) matching {description}."
+
+    # Listing (and "latest"): most recent matching result per patient
+    rows = store.query(
+        f"SELECT patient_id, value, unit, MAX(date) FROM lab_results WHERE {condition} "
+        f"GROUP BY patient_id ORDER BY MAX(date) DESC",
+        tuple(params)
+    )
+    if not rows:
+        return None
+    if patient_id and len(rows) == 1:
+        _, value, unit, on = rows[0]
+        return f"{label}: {_format_value(value, unit)} on {on}."
+    listed = ", ".join(
+        f"patient {pid} ({label} {_format_value(value, unit)} on {on})"
+        for pid, value, unit, on in rows[:MAX_LISTED_PATIENTS]
+    )
+    more = f" and {len(rows) - MAX_LISTED_PATIENTS} more" if len(rows) > MAX_LISTED_PATIENTS else ""
+    return f"{len(rows)} patient(s) with {description}: {listed}{more}."
+
+
+_fact_store: Optional[FactStore] = None
+
+
+def get_fact_store() -> FactStore:
+    """Process-wide fact store (one connection per worker process)"""
+    global _fact_store
+    if _fact_store is None:
+        _fact_store = FactStore()
+    return _fact_store
@@ -1,23 +1,59 @@
-from fastapi import FastAPI, HTTPException
+import os
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import logging
-from rag import index_document, run_pipeline
+from rag import index_document, index_documents, delete_document, run_pipeline, run_batch_pipeline
+from tracing import TRACE_HEADER, start_request, finish_request
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Worker processes share one memory-mapped index snapshot (see store.py)
+RAG_WORKERS = int(os.getenv("RAG_WORKERS", "1"))
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "256"))
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Continue the caller's trace and time the request; slow requests get a profile"""
+    state = start_request(f"{request.method} {request.url.path}", request.headers.get(TRACE_HEADER))
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[TRACE_HEADER] = state['span'].traceparent
+        return response
+    finally:
+        finish_request(state, status=status)
+
 class SearchQuery(BaseModel):
     query: str
     patient_id: Optional[str] = None
+    timeout: Optional[float] = None  # seconds the client will wait for an answer
+
+class BatchSearchItem(BaseModel):
+    query: str
+    patient_id: Optional[str] = None
+    synthesize: bool = False  # also generate an LLM answer for this item
+
+class BatchSearchQuery(BaseModel):
+    items: List[BatchSearchItem]
+    k: int = 3
+    timeout: Optional[float] = None  # seconds to wait for synthesized answers (LLM_BATCH_TIMEOUT by default)
 
 class Document(BaseModel):
     content: str
     metadata: Optional[Dict[str, Any]] = None
 
+class DocumentBatch(BaseModel):
+    documents: List[Document]
+
+class DocumentKey(BaseModel):
+    document_id: str  # "document_id" returned by /insert/
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -27,24 +63,65 @@ async def health_check():
 async def search(query: SearchQuery):
     """Search endpoint using RAG pipeline"""
     try:
-        answer = await run_pipeline(query.query, query.patient_id)
+        answer = await run_pipeline(query.query, query.patient_id, query.timeout)
         return {"answer": answer, "status": "success"}
     except Exception as e:
         logger.error(f"Error in search: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/search/batch")
+async def search_batch(batch: BatchSearchQuery):
+    """Retrieve for many queries with one embedding pass and one index search"""
+    if len(batch.items) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    if batch.k < 1:
+        raise HTTPException(status_code=422, detail="k must be at least 1")
+    try:
+        results = await run_batch_pipeline([item.model_dump() for item in batch.items], batch.k, batch.timeout)
+        return {"results": results, "status": "success"}
+    except Exception as e:
+        logger.error(f"Error in batch search: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/insert/")
 async def insert(document: Document):
     """Insert document into vector store"""
     try:
-        success = await index_document(document.content, document.metadata)
-        if not success:
+        result = await index_document(document.content, document.metadata)
+        if not result["success"]:
             raise HTTPException(status_code=500, detail="Failed to index document")
-        return {"status": "success"}
+        return {"status": "success", "duplicate": result["duplicate"], "document_id": result["document_id"]}
     except Exception as e:
         logger.error(f"Error in insert: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/insert/batch/")
+async def insert_batch(batch: DocumentBatch):
+    """Insert many documents with a single embedding pass and index write"""
+    try:
+        results = await index_documents(
+            [document.content for document in batch.documents],
+            [document.metadata or {} for document in batch.documents]
+        )
+        if not all(result["success"] for result in results):
+            raise HTTPException(status_code=500, detail="Failed to index documents")
+        return {"status": "success", "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in batch insert: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/delete/")
+async def delete(document: DocumentKey):
+    """Delete a document from the vector store; deleting a missing document is not an error"""
+    try:
+        deleted = await delete_document(document.document_id)
+        return {"status": "success", "deleted": deleted}
+    except Exception as e:
+        logger.error(f"Error in delete: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    uvicorn.run("main:app", host="0.0.0.0", port=8080, workers=RAG_WORKERS)
@@ -1,29 +1,38 @@
 import os
-import json
-import faiss
-import numpy as np
+import re
+import time
+import asyncio
+import hashlib
 import logging
+import itertools
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from sentence_transformers import SentenceTransformer
 import requests
+from store import get_vector_store, _fingerprint_key
+from facts import get_fact_store, parse_structured_query, answer_structured
+from summaries import SummaryStore, ReportSummarizer
+from tracing import span, current_profile, profiling, run_in_thread
+from chunking import chunk_text, chunk_metadata, iter_documents
 
 # Configure logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO"),
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
 # Ollama API endpoint
 OLLAMA_API = "http://localhost:11434/api"
+# Longest a single generation may take, also for requests without a deadline
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))
 
 class OllamaLLM:
     def __init__(self, model="llama2"):
         self.model = model
         self.api_url = f"{OLLAMA_API}/generate"
         
-    def generate(self, prompt: str, **kwargs) -> str:
+    def generate(self, prompt: str, timeout: float = LLM_REQUEST_TIMEOUT, **kwargs) -> str:
         try:
             response = requests.post(
                 self.api_url,
@@ -32,116 +41,188 @@ class OllamaLLM:
                     "prompt": prompt,
                     "stream": False,
                     **kwargs
-                }
+                },
+                timeout=timeout
             )
             response.raise_for_status()
             return response.json()["response"]
+        except requests.exceptions.Timeout:
+            logger.warning(f"Ollama did not answer within {timeout:.1f}s")
+            return None
         except Exception as e:
             logger.error(f"Error calling Ollama: {str(e)}")
             return None
 
+# LLM request priorities (lower runs first)
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# Default time budget for an interactive request without its own deadline
+INTERACTIVE_TIMEOUT = float(os.getenv("LLM_INTERACTIVE_TIMEOUT", "30"))
+# Default time budget for the synthesized answers of a batch search
+BATCH_TIMEOUT = float(os.getenv("LLM_BATCH_TIMEOUT", "120"))
+
+class LLMDeadlineExceeded(Exception):
+    """The request's deadline passed before the model answered"""
+
+# Result of a request dropped or cut off by its deadline
+_EXPIRED = object()
+
+class _LLMRequest:
+    def __init__(self, key, prompt: str, kwargs: Dict[str, Any], priority: int, deadline: Optional[float], future):
+        self.key = key
+        self.prompt = prompt
+        self.kwargs = kwargs
+        self.priority = priority
+        self.deadline = deadline
+        self.future = future
+        self.started = False
+        self.profile = current_profile()  # profile of the request that queued it
+
+class LLMScheduler:
+    """Serialises generation requests to the local model.
+
+    Identical in-flight prompts share one generation, lower priority values
+    run first, and requests whose deadline (time.monotonic()) has passed are
+    dropped before they reach the model.
+    """
+
+    def __init__(self, llm: OllamaLLM, concurrency: int = 1):
+        self.llm = llm
+        self.concurrency = concurrency
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._inflight: Dict[Any, _LLMRequest] = {}
+        self._sequence = itertools.count()
+        self._workers = []
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def generate(self, prompt: str, priority: int = INTERACTIVE,
+                       deadline: Optional[float] = None, **kwargs) -> Optional[str]:
+        """Queue a generation and wait for it.
+
+        Returns None if the model fails and raises LLMDeadlineExceeded once
+        `deadline` has passed.
+        """
+        self._ensure_workers()
+        key = (prompt, tuple(sorted(kwargs.items())))
+        request = self._inflight.get(key)
+
+        if request is None:
+            future = asyncio.get_running_loop().create_future()
+            request = _LLMRequest(key, prompt, kwargs, priority, deadline, future)
+            self._inflight[key] = request
+            self._queue.put_nowait((priority, next(self._sequence), request))
+        else:
+            # Coalesce: the shared request lives as long as its latest waiter
+            # and runs at the most urgent waiter's priority
+            if request.deadline is not None:
+                request.deadline = None if deadline is None else max(request.deadline, deadline)
+            if priority < request.priority and not request.started:
+                request.priority = priority
+                self._queue.put_nowait((priority, next(self._sequence), request))
+            logger.info("Coalesced LLM request with an identical in-flight prompt")
+
+        try:
+            if deadline is None:
+                result = await asyncio.shield(request.future)
+            else:
+                result = await asyncio.wait_for(asyncio.shield(request.future), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            logger.warning("LLM request deadline exceeded")
+            raise LLMDeadlineExceeded()
+        if result is _EXPIRED:
+            raise LLMDeadlineExceeded()
+        return result
+
+    async def _worker(self):
+        while True:
+            _, _, request = await self._queue.get()
+            # Skip stale entries left behind by a priority upgrade
+            if request.started or request.future.done():
+                continue
+            request.started = True
+            try:
+                timeout = LLM_REQUEST_TIMEOUT
+                if request.deadline is not None:
+                    remaining = request.deadline - time.monotonic()
+                    if remaining <= 0:
+                        logger.warning("Dropping expired LLM request")
+                        request.future.set_result(_EXPIRED)
+                        continue
+                    # Don't keep the model busy for an answer nobody waits for
+                    timeout = min(timeout, remaining)
+                with profiling(request.profile):
+                    result = await run_in_thread(self.llm.generate, request.prompt, timeout=timeout, **request.kwargs)
+                if result is None and request.deadline is not None and time.monotonic() >= request.deadline:
+                    result = _EXPIRED
+                request.future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error in LLM scheduler: {str(e)}")
+                if not request.future.done():
+                    request.future.set_result(None)
+            finally:
+                if self._inflight.get(request.key) is request:
+                    del self._inflight[request.key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'in_flight': len(self._inflight)
+        }
+
 # Initialize models
 logger.info("Initializing models...")
-EMBEDDING_MODEL = SentenceTransformer('all-MiniLM-L6-v2')  # Small, fast, good quality
+# The live index generation names the model it was embedded with (see
+# reindex.py); EMBEDDING_MODEL only applies until an index exists
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")  # Small, fast, good quality
+_embedding_models: Dict[str, SentenceTransformer] = {}
+
+def live_embedding_model_name() -> str:
+    """Embedding model of the live index generation"""
+    return get_vector_store().config().get('model') or EMBEDDING_MODEL_NAME
+
+def get_embedding_model(name: Optional[str] = None) -> SentenceTransformer:
+    """Load (once) the named embedding model, by default the live generation's"""
+    name = name or live_embedding_model_name()
+    model = _embedding_models.get(name)
+    if model is None:
+        logger.info(f"Loading embedding model {name}")
+        model = SentenceTransformer(name)
+        # Only the live model is needed once a switched generation is picked up
+        _embedding_models.clear()
+        _embedding_models[name] = model
+    return model
+
+get_embedding_model()
 LLM = OllamaLLM(model="llama2")  # Using Llama 2 from Ollama
+LLM_SCHEDULER = LLMScheduler(LLM, concurrency=int(os.getenv("LLM_CONCURRENCY", "1")))
 
-class VectorStore:
-    def __init__(self):
-        """Initialize vector store"""
-        self.index_path = "vector_store"
-        self.metadata_path = "vector_store/metadata.json"
-        
-        # Create directory if it doesn't exist
-        os.makedirs(self.index_path, exist_ok=True)
-        
-        # Load or create metadata
-        if os.path.exists(self.metadata_path):
-            with open(self.metadata_path, 'r') as f:
-                self.metadata = json.load(f)
-        else:
-            self.metadata = []
-            self._save_metadata()
-            
-        # Initialize FAISS index
-        self.dimension = 384  # MiniLM embedding dimension
-        if os.path.exists(os.path.join(self.index_path, "index.faiss")):
-            self.index = faiss.read_index(os.path.join(self.index_path, "index.faiss"))
-            logger.info(f"Loaded existing index with {self.index.ntotal} vectors")
-        else:
-            self.index = faiss.IndexFlatL2(self.dimension)
-            logger.info("Created new FAISS index")
-            
-    def _save_metadata(self):
-        """Save metadata to disk"""
-        with open(self.metadata_path, 'w') as f:
-            json.dump(self.metadata, f)
-            
-    def _save_index(self):
-        """Save FAISS index to disk"""
-        faiss.write_index(self.index, os.path.join(self.index_path, "index.faiss"))
-            
-    async def add_document(self, vector: List[float], metadata: Dict[str, Any]):
-        """Add a document to the vector store"""
-        try:
-            # Convert vector to numpy array
-            vector_np = np.array([vector], dtype=np.float32)
-            
-            # Add to index
-            self.index.add(vector_np)
-            self.metadata.append(metadata)
-            
-            # Save changes
-            self._save_metadata()
-            self._save_index()
-            
-            logger.info(f"Added document with metadata: {metadata}")
-            return True
-        except Exception as e:
-            logger.error(f"Error adding document: {str(e)}")
-            return False
-            
-    async def search(self, query_vector: List[float], k: int = 3, patient_id: Optional[str] = None):
-        """Search for similar documents"""
-        try:
-            # Convert query vector to numpy array
-            query_np = np.array([query_vector], dtype=np.float32)
-            
-            # Search in index
-            scores, indices = self.index.search(query_np, k)
-            
-            # Format results
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx < 0 or idx >= len(self.metadata):
-                    continue
-                    
-                metadata = self.metadata[idx]
-                
-                # Filter by patient_id if specified
-                if patient_id and metadata.get('patient_id') != patient_id:
-                    continue
-                    
-                results.append({
-                    'id': metadata.get('id', str(idx)),
-                    'score': float(score),
-                    'metadata': metadata
-                })
-                
-            logger.info(f"Found {len(results)} similar documents")
-            return results
-            
-        except Exception as e:
-            logger.error(f"Error searching: {str(e)}")
-            return []
+async def generate_summary(prompt: str) -> Optional[str]:
+    """Local LLM client for report summaries; runs behind interactive queries"""
+    return await LLM_SCHEDULER.generate(prompt, priority=BACKGROUND, temperature=0.2, num_predict=120)
+
+_summarizer: Optional[ReportSummarizer] = None
+
+def get_summarizer() -> ReportSummarizer:
+    global _summarizer
+    if _summarizer is None:
+        _summarizer = ReportSummarizer(generate_summary, SummaryStore())
+    return _summarizer
 
-async def get_embeddings(texts: List[str], input_type: str = "search_document") -> List[List[float]]:
-    """Get embeddings using Sentence Transformers"""
+async def get_embeddings(texts: List[str], input_type: str = "search_document",
+                         model_name: Optional[str] = None) -> List[List[float]]:
+    """Get embeddings using Sentence Transformers (the live index's model by default)"""
     try:
         # Ensure texts are strings and not too long
         texts = [str(text)[:4096] for text in texts]  # Limit text length
         
         # Generate embeddings
-        embeddings = EMBEDDING_MODEL.encode(texts, convert_to_numpy=True).tolist()
+        with span("embed", count=len(texts)):
+            embeddings = get_embedding_model(model_name).encode(texts, convert_to_numpy=True).tolist()
         logger.info(f"Generated {len(embeddings)} embeddings")
         return embeddings
         
@@ -149,7 +230,8 @@ async def get_embeddings(texts: List[str], input_type: str = "search_document")
         logger.error(f"Error getting embeddings: {str(e)}")
         return []
 
-async def synthesize_answer(query: str, context: str) -> str:
+async def synthesize_answer(query: str, context: str, priority: int = INTERACTIVE,
+                            deadline: Optional[float] = None) -> str:
     """Generate answer using Ollama"""
     try:
         # Prepare prompt
@@ -160,73 +242,262 @@ Question: {query}
 Answer: """
 
         # Generate response using Ollama
-        response = LLM.generate(
-            prompt,
-            temperature=0.7,
-            top_p=0.95,
-            num_predict=150  # Similar to max_tokens
-        )
+        with span("llm_generate", prompt_chars=len(prompt), priority=priority):
+            response = await LLM_SCHEDULER.generate(
+                prompt,
+                priority=priority,
+                deadline=deadline,
+                temperature=0.7,
+                top_p=0.95,
+                num_predict=150  # Similar to max_tokens
+            )
         
         if response is None:
             return "Error: Could not generate response. Please check if Ollama is running."
             
         return response.strip()
+
+    except LLMDeadlineExceeded:
+        return "Error: The answer took too long to generate. Please try again with more time."
         
     except Exception as e:
         logger.error(f"Error generating answer: {str(e)}")
         return "Error analyzing medical information. Please try again."
 
-async def run_pipeline(query: str, patient_id: Optional[str] = None) -> str:
+def build_contexts(results: List[Dict[str, Any]]) -> List[str]:
+    """LLM context passages for search results"""
+    # Prefer the precomputed report summary; fall back to truncated text
+    documents = [r['metadata'].get('document') or r['metadata'].get('fingerprint') for r in results]
+    summaries = get_summarizer().store.get_many(documents)
+
+    # Extract relevant contexts (shorter)
+    contexts = []
+    summarized = set()
+    for result, document in zip(results, documents):
+        if result['score'] > 0.5:  # Only use high-confidence matches
+            text = summaries.get(document)
+            if text:
+                # Several chunks of one report share its summary
+                if document in summarized:
+                    continue
+                summarized.add(document)
+            else:
+                text = result['metadata']['text']
+                if len(text) > 300:  # Reduced context size
+                    text = text[:300] + "..."
+            contexts.append(text)
+    return contexts
+
+async def run_pipeline(query: str, patient_id: Optional[str] = None, timeout: Optional[float] = None) -> str:
     """Run the complete RAG pipeline"""
     try:
+        deadline = time.monotonic() + (timeout or INTERACTIVE_TIMEOUT)
+
+        # Threshold, date-range and aggregate questions are answered from the
+        # structured fact index without retrieval or the LLM
+        structured = parse_structured_query(query)
+        if structured:
+            with span("structured_query"):
+                answer = answer_structured(get_fact_store(), structured, patient_id)
+            if answer:
+                logger.info("Answered query from structured fact index")
+                return answer
+
         # Generate query embedding
         embeddings = await get_embeddings([query])
         if not embeddings:
             return "Failed to process query. Please try again."
             
         # Search with reduced k for faster response
-        vector_store = VectorStore()
+        vector_store = get_vector_store()
         results = await vector_store.search(embeddings[0], k=2, patient_id=patient_id)
         
         if not results:
             return "No relevant medical records found."
         
-        # Extract relevant contexts (shorter)
-        contexts = []
-        for result in results:
-            if result['score'] > 0.5:  # Only use high-confidence matches
-                text = result['metadata']['text']
-                if len(text) > 300:  # Reduced context size
-                    text = text[:300] + "..."
-                contexts.append(text)
-        
+        contexts = build_contexts(results)
         if not contexts:
             return "No relevant information found."
         
         # Join contexts and generate answer
         context = "\n---\n".join(contexts)
-        return await synthesize_answer(query, context)
+        return await synthesize_answer(query, context, priority=INTERACTIVE, deadline=deadline)
         
     except Exception as e:
         logger.error(f"Error in RAG pipeline: {str(e)}")
         return f"Error: {str(e)}"
 
-async def index_document(text: str, metadata: Dict[str, Any] = None) -> bool:
-    """Index a document in the vector store"""
+async def answer_from_results(query: str, patient_id: Optional[str], results: List[Dict[str, Any]],
+                              deadline: Optional[float]) -> str:
+    """Answer a batch item from its retrieval results"""
+    structured = parse_structured_query(query)
+    if structured:
+        answer = answer_structured(get_fact_store(), structured, patient_id)
+        if answer:
+            return answer
+    if not results:
+        return "No relevant medical records found."
+    contexts = build_contexts(results)
+    if not contexts:
+        return "No relevant information found."
+    return await synthesize_answer(query, "\n---\n".join(contexts), priority=BACKGROUND, deadline=deadline)
+
+async def run_batch_pipeline(items: List[Dict[str, Any]], k: int = 3,
+                             timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Retrieve for many queries with one embedding pass and one index search.
+
+    Items are dicts with query, patient_id and synthesize; only items with
+    synthesize set get an LLM answer, generated at background priority and
+    abandoned after `timeout` seconds (LLM_BATCH_TIMEOUT by default).
+    """
+    if not items:
+        return []
+    deadline = time.monotonic() + (timeout or BATCH_TIMEOUT)
+
+    embeddings = await get_embeddings([item['query'] for item in items])
+    if len(embeddings) != len(items):
+        raise RuntimeError("Failed to embed queries")
+
+    vector_store = get_vector_store()
+    batch_results = await vector_store.search_batch(embeddings, k=k, patient_ids=[item.get('patient_id') for item in items])
+
+    responses = [
+        {'query': item['query'], 'patient_id': item.get('patient_id'), 'results': results}
+        for item, results in zip(items, batch_results)
+    ]
+    synthesized = [i for i, item in enumerate(items) if item.get('synthesize')]
+    if synthesized:
+        with span("batch_synthesis", count=len(synthesized)):
+            answers = await asyncio.gather(*(
+                answer_from_results(items[i]['query'], items[i].get('patient_id'), batch_results[i], deadline)
+                for i in synthesized
+            ))
+        for i, answer in zip(synthesized, answers):
+            responses[i]['answer'] = answer
+    return responses
+
+def content_fingerprint(text: str) -> str:
+    """Fingerprint document text, ignoring whitespace differences"""
+    normalized = re.sub(r'\s+', ' ', text).strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+async def index_document(text: str, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Index a document in the vector store.
+
+    Returns {"success": bool, "duplicate": bool, "document_id": str}; an exact
+    duplicate of a document already indexed for the same patient is not
+    embedded again and shares the original's document_id.
+    """
+    results = await index_documents([text], [metadata or {}])
+    return results[0]
+
+async def index_documents(texts: List[str], metadatas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Index a batch of documents with one embedding pass and one index write"""
     try:
+        vector_store = get_vector_store()
+        results = [{"success": True, "duplicate": False} for _ in texts]
+
+        # Drop duplicates of indexed content and repeats within the batch
+        seen = set()
+        pending = []
+        for i, (text, metadata) in enumerate(zip(texts, metadatas)):
+            fingerprint = content_fingerprint(text)
+            key = (metadata.get('patient_id'), fingerprint)
+            # Callers delete the document by this key (see delete_document)
+            results[i]["document_id"] = _fingerprint_key(metadata.get('patient_id'), fingerprint)
+            if key in seen or vector_store.find_duplicate(fingerprint, metadata.get('patient_id')):
+                logger.info(f"Duplicate document detected (fingerprint {fingerprint[:12]})")
+                results[i]["duplicate"] = True
+                continue
+            seen.add(key)
+            metadata['text'] = text
+            metadata['fingerprint'] = fingerprint
+            pending.append(i)
+
+        if not pending:
+            return results
+
+        # Chunk the way the live index was built (see reindex.py)
+        config = vector_store.config()
+        model_name = config.get('model') or EMBEDDING_MODEL_NAME
+        entries = []
+        for i in pending:
+            chunks = chunk_text(texts[i], config.get('chunk_size', 0), config.get('chunk_overlap', 0))
+            entries.extend(chunk_metadata(metadatas[i], chunks))
+
         # Generate embeddings
-        embeddings = await get_embeddings([text])
-        if not embeddings:
-            return False
-            
+        embeddings = await get_embeddings([entry['text'] for entry in entries], model_name=model_name)
+        if len(embeddings) != len(entries):
+            return [{"success": False, "duplicate": False} for _ in texts]
+
         # Add to vector store
-        vector_store = VectorStore()
-        metadata = metadata or {}
-        metadata['text'] = text
-        
-        success = await vector_store.add_document(embeddings[0], metadata)
-        return success
-        
+        success = await vector_store.add_documents(embeddings, entries, model=model_name)
+        if not success:
+            for i in pending:
+                results[i]["success"] = False
+            return results
+
+        # Structured lab values and diagnoses for filter-style queries
+        try:
+            fact_store = get_fact_store()
+            with span("extract_facts", count=len(pending)):
+                for i in pending:
+                    fact_store.add_document(metadatas[i]['fingerprint'], texts[i], metadatas[i])
+        except Exception as e:
+            logger.error(f"Error extracting structured facts: {str(e)}")
+
+        # Summarise new reports in the background for compact query-time context;
+        # when the LLM falls behind, the rest are left to backfill.py
+        summarizer = get_summarizer()
+        for i in pending:
+            summarizer.submit(metadatas[i]['fingerprint'], texts[i])
+        return results
+
     except Exception as e:
-        logger.error(f"Error indexing document: {str(e)}")
-        return False
+        logger.error(f"Error indexing documents: {str(e)}")
+        return [{"success": False, "duplicate": False} for _ in texts]
+
+async def delete_document(document_id: str) -> int:
+    """Delete a document (by the key returned from indexing) and its facts; returns vectors removed"""
+    deleted = await get_vector_store().delete_document(document_id)
+    if deleted:
+        patient_id, _, fingerprint = document_id.rpartition('|')
+        try:
+            get_fact_store().delete_document(fingerprint, patient_id or None)
+        except Exception as e:
+            logger.error(f"Error deleting structured facts: {str(e)}")
+    return deleted
+
+async def backfill_documents(max_pending: int = 32) -> Dict[str, int]:
+    """Extract facts and summaries for live documents that have none.
+
+    Covers documents indexed before fact extraction and summaries existed,
+    and generations rebuilt by reindex.py, which never pass through
+    index_documents. Safe to re-run: finished documents are skipped.
+    """
+    vector_store = get_vector_store()
+    snapshot = vector_store.refresh()
+    counts = {"documents": 0, "facts": 0, "summaries": 0}
+    if snapshot is None:
+        return counts
+
+    fact_store = get_fact_store()
+    summarizer = get_summarizer()
+    overlap = snapshot.config.get('chunk_overlap', 0)
+    for document, _ in iter_documents(snapshot.iter_metadata(), overlap):
+        text = document.get('text', '')
+        fingerprint = document.get('fingerprint') or content_fingerprint(text)
+        counts["documents"] += 1
+        try:
+            if not fact_store.has_document(fingerprint, document.get('patient_id')):
+                fact_store.add_document(fingerprint, text, document)
+                counts["facts"] += 1
+        except Exception as e:
+            logger.error(f"Error extracting structured facts: {str(e)}")
+        if not summarizer.store.has(fingerprint):
+            # Bound the reports held in memory while the LLM catches up
+            await summarizer.wait(max_pending)
+            if summarizer.submit(fingerprint, text):
+                counts["summaries"] += 1
+    await summarizer.wait()
+    return counts
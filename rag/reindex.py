@@ -0,0 +1,302 @@
+"""Offline re-index of the vector store.
+
+Re-embeds every document of the live generation with a new embedding model,
+chunking or index type across a process pool and publishes the result as a
+new generation. Progress is checkpointed per batch, so an interrupted run
+picks up where it stopped when started again with the same settings.
+
+    python reindex.py --model all-MiniLM-L6-v2 --chunk-size 1000 --chunk-overlap 200 --index-type hnsw
+
+Running services switch to the new generation's embedding model (named in
+its config.json) when they pick the generation up.
+
+Re-indexed documents skip fact extraction and summarisation; run
+backfill.py afterwards to fill in any that are missing.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+
+import faiss
+import numpy as np
+
+from store import VECTOR_STORE_DIR, VectorStore, _fingerprint_key
+from chunking import chunk_text, chunk_metadata, iter_documents
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf')
+DEFAULT_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+RAG_WORKERS = int(os.getenv("RAG_WORKERS", "1"))  # worker processes of the live service (see main.py)
+MAX_TEXT_CHARS = 4096  # same limit as get_embeddings
+HNSW_NEIGHBORS = 32
+HNSW_EF_SEARCH = 64
+
+_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    """Load the embedding model once per worker process"""
+    global _model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(threads)
+    _model = SentenceTransformer(model_name)
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    texts = [str(text)[:MAX_TEXT_CHARS] for text in texts]
+    return _model.encode(texts, convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+
+
+def build_index(index_type: str, vectors: np.ndarray):
+    """Create and fill a FAISS index of the requested type"""
+    count, dimension = vectors.shape
+    if index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, HNSW_NEIGHBORS)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == 'ivf' and count:
+        nlist = max(1, min(count, int(4 * np.sqrt(count))))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, nlist)
+        index.train(vectors)
+        index.nprobe = max(1, nlist // 16)
+    else:
+        index = faiss.IndexFlatL2(dimension)
+    if count:
+        index.add(vectors)
+    return index
+
+
+class Checkpoint:
+    """Batches embedded so far, stored next to the live generations.
+
+    Every finished batch is written as batch-NNNNNN.npy (vectors) and
+    batch-NNNNNN.jsonl (metadata) before state.json records it, so state.json
+    never points at a partial batch.
+    """
+
+    def __init__(self, store_path: str, config: Dict[str, Any], build_id: str, restart: bool = False):
+        digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.directory = os.path.join(store_path, f"reindex-{digest}")
+        self.state_path = os.path.join(self.directory, "state.json")
+        self.state = None
+        if not restart and os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                self.state = json.load(f)
+            if self.state.get('build_id') != build_id:
+                logger.warning("Live index was rebuilt since the checkpoint was taken, starting over")
+                self.state = None
+        if self.state is None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.makedirs(self.directory)
+            self.state = {'build_id': build_id, 'config': config, 'batches': 0, 'docs': 0, 'entries': 0}
+            self._save_state()
+
+    def _batch_path(self, batch: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"batch-{batch:06d}{suffix}")
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def add_batch(self, vectors: np.ndarray, metadatas: List[Dict[str, Any]], docs: int, entries: int):
+        batch = self.state['batches']
+        np.save(self._batch_path(batch, ".npy"), vectors)
+        with open(self._batch_path(batch, ".jsonl"), 'w') as f:
+            for metadata in metadatas:
+                f.write(json.dumps(metadata) + '\n')
+        self.state.update(
+            batches=batch + 1,
+            docs=self.state['docs'] + docs,
+            entries=self.state['entries'] + entries
+        )
+        self._save_state()
+
+    def load(self) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        vectors = []
+        metadatas = []
+        for batch in range(self.state['batches']):
+            vectors.append(np.load(self._batch_path(batch, ".npy")))
+            with open(self._batch_path(batch, ".jsonl"), 'r') as f:
+                metadatas.extend(json.loads(line) for line in f)
+        return (np.concatenate(vectors) if vectors else None), metadatas
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def iter_batches(entries, source_overlap: int, config: Dict[str, Any],
+                 batch_size: int) -> Iterator[Tuple[List[Dict[str, Any]], int, int]]:
+    """Yield (chunk metadata, documents, source entries consumed) per batch of documents"""
+    batch = []
+    docs = 0
+    consumed = 0
+    for document, count in iter_documents(entries, source_overlap):
+        chunks = chunk_text(document['text'], config['chunk_size'], config['chunk_overlap'])
+        batch.extend(chunk_metadata(document, chunks))
+        docs += 1
+        consumed += count
+        if docs >= batch_size:
+            yield batch, docs, consumed
+            batch, docs, consumed = [], 0, 0
+    if docs:
+        yield batch, docs, consumed
+
+
+class Progress:
+    """Documents-per-second readout on stderr"""
+
+    def __init__(self, total_docs: int, done_docs: int):
+        self.total = total_docs
+        self.done = done_docs
+        self.started_at = time.monotonic()
+        self.run_docs = 0
+
+    def update(self, docs: int):
+        self.done += docs
+        self.run_docs += docs
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        rate = self.run_docs / elapsed
+        remaining = (self.total - self.done) / rate if rate and self.total > self.done else 0
+        print(f"\r{self.done}/{self.total} documents  {rate:.1f} docs/sec  ~{remaining:.0f}s left",
+              end='', file=sys.stderr, flush=True)
+
+    def finish(self):
+        print(file=sys.stderr, flush=True)
+
+
+def parse_args(live_config: Dict[str, Any]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Re-embed the vector store into a new index generation")
+    parser.add_argument("--model", default=live_config.get('model', DEFAULT_MODEL),
+                        help="sentence-transformers model name")
+    parser.add_argument("--chunk-size", type=int, default=live_config.get('chunk_size', 0),
+                        help="characters per chunk (0 keeps documents whole)")
+    parser.add_argument("--chunk-overlap", type=int, default=live_config.get('chunk_overlap', 0),
+                        help="characters shared by consecutive chunks")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=live_config.get('index_type', 'flat'))
+    parser.add_argument("--batch-size", type=int, default=256, help="documents per embedding batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="embedding processes")
+    parser.add_argument("--restart", action="store_true", help="discard any checkpoint and start over")
+    args = parser.parse_args()
+    if args.chunk_size < 0 or args.chunk_overlap < 0:
+        parser.error("chunk sizes must not be negative")
+    if args.chunk_size and args.chunk_overlap >= args.chunk_size:
+        parser.error("--chunk-overlap must be smaller than --chunk-size")
+    if args.batch_size < 1 or args.workers < 1:
+        parser.error("--batch-size and --workers must be at least 1")
+    if args.index_type != 'flat' and RAG_WORKERS > 1:
+        # Flat vectors are memory-mapped and shared; HNSW/IVF indexes are not
+        parser.error(f"--index-type {args.index_type} would load a private copy of the index into each of "
+                     f"the {RAG_WORKERS} RAG workers; use flat or run the service with RAG_WORKERS=1")
+    return args
+
+
+def main():
+    store = VectorStore(VECTOR_STORE_DIR)
+    snapshot = store.refresh()
+    live_config = snapshot.config if snapshot is not None else {}
+    args = parse_args(live_config)
+    if snapshot is None:
+        logger.info("Vector store is empty, nothing to re-index")
+        return
+
+    config = {
+        'model': args.model,
+        'chunk_size': args.chunk_size,
+        'chunk_overlap': args.chunk_overlap,
+        'index_type': args.index_type
+    }
+    source_overlap = live_config.get('chunk_overlap', 0)
+    checkpoint = Checkpoint(store.path, config, live_config.get('build_id'), args.restart)
+    state = checkpoint.state
+    total_docs = sum(1 for _ in iter_documents(snapshot.iter_metadata(), source_overlap))
+    if state['entries']:
+        logger.info(f"Resuming after {state['docs']} documents ({state['batches']} batches)")
+    logger.info(f"Re-indexing {total_docs} documents with {config} on {args.workers} worker(s)")
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    progress = Progress(total_docs, state['docs'])
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(args.model, threads)) as pool:
+        # Keep every worker busy but write batches in order so the checkpoint stays contiguous
+        in_flight = deque()
+        batches = iter_batches(snapshot.iter_metadata(state['entries']), source_overlap, config, args.batch_size)
+        for metadatas, docs, consumed in batches:
+            future = pool.submit(_embed, [m['text'] for m in metadatas])
+            in_flight.append((future, metadatas, docs, consumed))
+            if len(in_flight) >= args.workers * 2:
+                future, metadatas, docs, consumed = in_flight.popleft()
+                checkpoint.add_batch(future.result(), metadatas, docs, consumed)
+                progress.update(docs)
+        while in_flight:
+            future, metadatas, docs, consumed = in_flight.popleft()
+            checkpoint.add_batch(future.result(), metadatas, docs, consumed)
+            progress.update(docs)
+        progress.finish()
+
+        vectors, metadatas = checkpoint.load()
+        if vectors is None:
+            vectors = np.zeros((0, pool.submit(_embed, [""]).result().shape[1]), dtype=np.float32)
+        fingerprints = {}
+        for idx, metadata in enumerate(metadatas):
+            if metadata.get('fingerprint'):
+                fingerprints.setdefault(_fingerprint_key(metadata.get('patient_id'), metadata['fingerprint']), idx)
+        started_at = time.monotonic()
+        index = build_index(args.index_type, vectors)
+        logger.info(f"Built {args.index_type} index with {index.ntotal} vectors in {time.monotonic() - started_at:.1f}s")
+
+        def catch_up(generation: int):
+            """Embed documents inserted into the live index while we were running"""
+            live = store.refresh()
+            if live.config.get('build_id') != state['build_id']:
+                raise RuntimeError("Live index was rebuilt during the re-index")
+            added = 0
+            for new_metadatas, docs, _ in iter_batches(live.iter_metadata(state['entries']), source_overlap,
+                                                       config, args.batch_size):
+                # Skip documents already re-embedded, every chunk of them
+                new_metadatas = [
+                    m for m in new_metadatas
+                    if _fingerprint_key(m.get('patient_id'), m['document']) not in fingerprints
+                ]
+                if not new_metadatas:
+                    continue
+                for metadata in new_metadatas:
+                    if metadata.get('fingerprint'):
+                        fingerprints[_fingerprint_key(metadata.get('patient_id'), metadata['fingerprint'])] = len(metadatas)
+                    metadatas.append(metadata)
+                index.add(pool.submit(_embed, [m['text'] for m in new_metadatas]).result())
+                added += docs
+            if added:
+                logger.info(f"Caught up with {added} document(s) added during the re-index")
+
+            # Documents deleted from the live index after we embedded them
+            for key, idx in fingerprints.items():
+                live_idx = live.fingerprints.get(key)
+                if live_idx is None or not live.is_deleted(live_idx):
+                    continue
+                document = metadatas[idx]['fingerprint']
+                deleted.append(idx)
+                while deleted[-1] + 1 < len(metadatas) and metadatas[deleted[-1] + 1].get('chunk', 0) != 0 \
+                        and metadatas[deleted[-1] + 1].get('document') == document:
+                    deleted.append(deleted[-1] + 1)
+
+        deleted = []
+        generation = store.publish_generation(index, metadatas, fingerprints, config, catch_up=catch_up,
+                                              deleted=deleted)
+
+    checkpoint.remove()
+    logger.info(f"Published generation {generation} with {index.ntotal} vectors")
+
+
+if __name__ == "__main__":
+    main()
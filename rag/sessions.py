@@ -0,0 +1,91 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def memory_size(memory: Any) -> int:
+    """Approximate size of a conversation memory in characters"""
+    size = len(getattr(memory, 'moving_summary_buffer', '') or '')
+    for message in memory.chat_memory.messages:
+        size += len(message.content)
+    return size
+
+
+class SessionMemoryStore:
+    """Per-session conversation memories with LRU eviction.
+
+    Sessions idle for longer than `idle_timeout` seconds are dropped, at most
+    `max_sessions` are kept, and the least recently used sessions are evicted
+    while the combined history exceeds `max_total_chars`.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        max_sessions: int = 1000,
+        idle_timeout: float = 1800,
+        max_total_chars: int = 20_000_000
+    ):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_total_chars = max_total_chars
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()  # id -> [memory, last_used, size]
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Any:
+        """Return the session's memory, creating it if needed, and mark it recently used"""
+        with self._lock:
+            self._expire()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = [self.factory(), time.monotonic(), 0]
+                self._sessions[session_id] = entry
+                while len(self._sessions) > self.max_sessions:
+                    self._evict_oldest()
+            else:
+                entry[1] = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def update(self, session_id: str):
+        """Re-measure a session after a turn was saved and enforce the memory cap"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            size = memory_size(entry[0])
+            self._total_chars += size - entry[2]
+            entry[2] = size
+            while self._total_chars > self.max_total_chars and len(self._sessions) > 1:
+                self._evict_oldest()
+
+    def clear(self, session_id: str) -> bool:
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return False
+            self._total_chars -= entry[2]
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'sessions': len(self._sessions), 'total_chars': self._total_chars}
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if entry[1] >= cutoff:
+                break
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        session_id, entry = self._sessions.popitem(last=False)
+        self._total_chars -= entry[2]
+        logger.info(f"Evicted conversation session {session_id}")
@@ -0,0 +1,683 @@
+import os
+import json
+import uuid
+import mmap
+import fcntl
+import shutil
+import logging
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Any, Optional
+
+import faiss
+import numpy as np
+
+from tracing import span, run_in_thread
+
+logger = logging.getLogger(__name__)
+
+# Vector store layout:
+#   vector_store/CURRENT            name of the live generation directory
+#   vector_store/gen-000042/        one immutable snapshot
+#       config.json                 build id, embedding model, chunking, index type and dimension
+#       segments.json               ordered segments making up the generation
+#       deleted.npy                 ids of deleted vectors (sorted), dropped by the next re-index
+#   vector_store/segments/seg-<id>/ an immutable run of vectors shared by generations
+#       vectors.f32                 raw float32 vectors (memory-mapped by readers)
+#       index.faiss                 HNSW/IVF index of a re-indexed base segment (loaded by each reader)
+#       metadata.jsonl              one JSON document per vector
+#       offsets.npy                 byte offsets into metadata.jsonl (n + 1)
+#       fingerprints.json           "<patient_id>|<fingerprint>" -> vector id within the segment
+#       patients.json               patient_id -> vector ids within the segment
+#   vector_store/.write.lock        serialises writers across processes
+#
+# A write publishes a generation listing the previous generation's segments
+# plus one new delta segment, so existing vectors and metadata are never
+# copied. Small trailing segments are merged as they accumulate, which keeps
+# the segment count logarithmic in the number of writes.
+#
+# Flat segments are shared by all worker processes through the page cache.
+# An HNSW/IVF base segment is read into the memory of every worker, so
+# reindex.py refuses those index types when RAG_WORKERS > 1.
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_store")
+SEGMENTS_DIR = "segments"
+KEEP_GENERATIONS = 2
+# A trailing segment is merged into the one before it while that one holds
+# at most this many times as many vectors
+MERGE_FACTOR = 2
+
+
+def _fingerprint_key(patient_id: Optional[str], fingerprint: str) -> str:
+    return f"{patient_id or ''}|{fingerprint}"
+
+
+def _generation_name(generation: int) -> str:
+    return f"gen-{generation:06d}"
+
+
+def _read_config(directory: Optional[str]) -> Dict[str, Any]:
+    config_path = os.path.join(directory, "config.json") if directory else None
+    if config_path and os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def _read_segments(directory: str) -> List[Dict[str, Any]]:
+    with open(os.path.join(directory, "segments.json"), 'r') as f:
+        return json.load(f)
+
+
+def _patient_ids(metadatas) -> Dict[str, List[int]]:
+    patients: Dict[str, List[int]] = {}
+    for idx, metadata in enumerate(metadatas):
+        if metadata.get('patient_id'):
+            patients.setdefault(metadata['patient_id'], []).append(idx)
+    return patients
+
+
+def _load_patients(directory: str) -> Dict[str, List[int]]:
+    patients_path = os.path.join(directory, "patients.json")
+    if os.path.exists(patients_path):
+        with open(patients_path, 'r') as f:
+            return json.load(f)
+    # Segment written before patients.json existed
+    with open(os.path.join(directory, "metadata.jsonl"), 'rb') as f:
+        return _patient_ids(json.loads(line) for line in f)
+
+
+def _knn(queries: np.ndarray, vectors: Optional[np.ndarray], k: int):
+    """Exact L2 search in IndexFlatL2.search layout: squared distances and ids, padded with -1"""
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    found = min(k, len(vectors) if vectors is not None else 0)
+    if found:
+        distances[:, :found], ids[:, :found] = faiss.knn(queries, vectors, found)
+    return distances, ids
+
+
+class Segment:
+    """One immutable run of vectors with their metadata.
+
+    Vectors are searched straight from the memory-mapped vectors.f32:
+    faiss.IndexFlat always reads its vectors into process memory, even with
+    IO_FLAG_MMAP, so every worker would hold a private copy.
+    """
+
+    def __init__(self, directory: str, dimension: int, load_index: bool = True):
+        self.directory = directory
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode='r')
+        self.count = len(self.offsets) - 1
+        vectors_path = os.path.join(directory, "vectors.f32")
+        self.vectors = (
+            np.memmap(vectors_path, dtype=np.float32, mode='r', shape=(self.count, dimension))
+            if self.count else None
+        )
+        index_path = os.path.join(directory, "index.faiss")
+        self.index = faiss.read_index(index_path) if load_index and os.path.exists(index_path) else None
+        self._fingerprints = None
+        self._patients = None
+
+        # Metadata stays on disk; pages are shared between worker processes
+        with open(os.path.join(directory, "metadata.jsonl"), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._metadata = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def metadata(self, idx: int) -> Dict[str, Any]:
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return json.loads(self._metadata[start:end])
+
+    @property
+    def fingerprints(self) -> Dict[str, int]:
+        if self._fingerprints is None:
+            with open(os.path.join(self.directory, "fingerprints.json"), 'r') as f:
+                self._fingerprints = json.load(f)
+        return self._fingerprints
+
+    def patient_ids(self, patient_id: str) -> np.ndarray:
+        """Vector ids within the segment belonging to the patient"""
+        if self._patients is None:
+            self._patients = {
+                key: np.array(ids, dtype=np.int64) for key, ids in _load_patients(self.directory).items()
+            }
+        return self._patients.get(patient_id, np.zeros(0, dtype=np.int64))
+
+    def search(self, queries: np.ndarray, k: int):
+        if self.index is not None:
+            return self.index.search(queries, k)
+        return _knn(queries, self.vectors, k)
+
+
+class IndexSnapshot:
+    """Read-only view of one vector store generation"""
+
+    def __init__(self, directory: str, generation: int, segments_path: str, load_index: bool = True):
+        self.directory = directory
+        self.generation = generation
+        self.config = _read_config(directory)
+        self.segment_info = _read_segments(directory)
+        self.segments = [
+            Segment(os.path.join(segments_path, info['name']), self.config['dimension'], load_index)
+            for info in self.segment_info
+        ]
+        self.starts = np.cumsum([0] + [segment.count for segment in self.segments])
+        self.d = self.config.get('dimension', 0)
+        self.ntotal = int(self.starts[-1])
+        self._fingerprints = None
+        deleted_path = os.path.join(directory, "deleted.npy")
+        self.deleted = np.load(deleted_path) if os.path.exists(deleted_path) else np.zeros(0, dtype=np.int64)
+        self._deleted = set(self.deleted.tolist())
+
+    def __len__(self) -> int:
+        return self.ntotal
+
+    def _locate(self, idx: int):
+        position = int(np.searchsorted(self.starts, idx, side='right')) - 1
+        return self.segments[position], idx - int(self.starts[position])
+
+    def metadata(self, idx: int) -> Dict[str, Any]:
+        segment, local = self._locate(idx)
+        return segment.metadata(local)
+
+    def is_deleted(self, idx: int) -> bool:
+        return idx in self._deleted
+
+    def iter_metadata(self, start: int = 0):
+        """Metadata of every vector from `start`; deleted ones are marked "deleted" """
+        for idx in range(start, len(self)):
+            metadata = self.metadata(idx)
+            if idx in self._deleted:
+                metadata['deleted'] = True
+            yield metadata
+
+    def document_id(self, key: str) -> Optional[int]:
+        """Vector id of the first chunk of a live document"""
+        idx = self.fingerprints.get(key)
+        return None if idx is None or idx in self._deleted else idx
+
+    @property
+    def fingerprints(self) -> Dict[str, int]:
+        """Document key -> vector id of its first chunk; later segments take precedence"""
+        if self._fingerprints is None:
+            fingerprints = {}
+            for segment, start in zip(self.segments, self.starts):
+                fingerprints.update((key, int(start) + idx) for key, idx in segment.fingerprints.items())
+            self._fingerprints = fingerprints
+        return self._fingerprints
+
+    def search_patient(self, queries: np.ndarray, k: int, patient_id: str):
+        """Exact search over the patient's live vectors only, in IndexFlatL2.search layout"""
+        ids = []
+        vectors = []
+        for segment, start in zip(self.segments, self.starts):
+            local_ids = segment.patient_ids(patient_id)
+            if len(local_ids):
+                ids.append(local_ids + int(start))
+                vectors.append(segment.vectors[local_ids])
+        if not ids:
+            return _knn(queries, None, k)
+        ids = np.concatenate(ids)
+        vectors = np.concatenate(vectors)
+        if len(self.deleted):
+            live = ~np.isin(ids, self.deleted)
+            ids, vectors = ids[live], vectors[live]
+        distances, rows = _knn(queries, vectors, k)
+        return distances, np.where(rows >= 0, ids[rows], -1)
+
+    def search(self, queries: np.ndarray, k: int):
+        """Search every segment and merge into IndexFlatL2.search layout"""
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for segment, start in zip(self.segments, self.starts):
+            if not segment.count:
+                continue
+            # Fetch past the deleted vectors of the segment, then drop them
+            end = int(start) + segment.count
+            deleted = int(np.searchsorted(self.deleted, end) - np.searchsorted(self.deleted, start))
+            segment_distances, segment_ids = segment.search(queries, min(k + deleted, segment.count))
+            segment_ids = np.where(segment_ids >= 0, segment_ids + int(start), -1)
+            if deleted:
+                segment_ids = np.where(np.isin(segment_ids, self.deleted), -1, segment_ids)
+            segment_distances = np.where(segment_ids >= 0, segment_distances, np.inf)
+            merged_distances = np.concatenate([distances, segment_distances], axis=1)
+            merged_ids = np.concatenate([ids, segment_ids], axis=1)
+            order = np.argsort(merged_distances, axis=1, kind='stable')[:, :k]
+            distances = np.take_along_axis(merged_distances, order, axis=1)
+            ids = np.take_along_axis(merged_ids, order, axis=1)
+        return distances, ids
+
+
+class VectorStore:
+    """FAISS vector store shared by several worker processes.
+
+    Readers memory-map the live generation and pick up new generations
+    without restarting. Writers take an exclusive file lock, publish the
+    next generation as the latest one's segments plus a delta segment and
+    switch CURRENT atomically.
+    """
+
+    def __init__(self, path: str = VECTOR_STORE_DIR):
+        self.path = path
+        self.segments_path = os.path.join(path, SEGMENTS_DIR)
+        self.current_path = os.path.join(path, "CURRENT")
+        self.lock_path = os.path.join(path, ".write.lock")
+        self.snapshot: Optional[IndexSnapshot] = None
+
+        # Create directory if it doesn't exist
+        os.makedirs(self.segments_path, exist_ok=True)
+        self._migrate_legacy()
+        self._migrate_unsegmented()
+        self.refresh()
+
+    @contextmanager
+    def write_lock(self):
+        """Exclusive cross-process lock held for the duration of a write"""
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def current_generation(self) -> int:
+        try:
+            with open(self.current_path, 'r') as f:
+                return int(f.read().strip().split('-')[-1])
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _open(self, generation: int, load_index: bool = True) -> IndexSnapshot:
+        directory = os.path.join(self.path, _generation_name(generation))
+        return IndexSnapshot(directory, generation, self.segments_path, load_index)
+
+    def refresh(self) -> Optional[IndexSnapshot]:
+        """Switch to the live generation if another process has published a newer one"""
+        generation = self.current_generation()
+        if generation and (self.snapshot is None or self.snapshot.generation != generation):
+            self.snapshot = self._open(generation)
+            logger.info(f"Loaded index generation {generation} with {self.snapshot.ntotal} vectors "
+                        f"in {len(self.snapshot.segments)} segment(s)")
+        return self.snapshot
+
+    def config(self) -> Dict[str, Any]:
+        """Build settings of the live generation (model, chunking, index type)"""
+        snapshot = self.refresh()
+        return snapshot.config if snapshot is not None else {}
+
+    def find_duplicate(self, fingerprint: str, patient_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return metadata of an indexed document with the same content for the patient"""
+        snapshot = self.refresh()
+        if snapshot is None:
+            return None
+        idx = snapshot.document_id(_fingerprint_key(patient_id, fingerprint))
+        return snapshot.metadata(idx) if idx is not None else None
+
+    async def add_document(self, vector: List[float], metadata: Dict[str, Any]):
+        """Add a document to the vector store"""
+        return await self.add_documents([vector], [metadata])
+
+    async def add_documents(self, vectors: List[List[float]], metadatas: List[Dict[str, Any]],
+                            model: Optional[str] = None):
+        """Add documents to the vector store in a single new generation.
+
+        `model` names the embedding model the vectors came from; the write is
+        refused if the live generation was built with a different one.
+        """
+        try:
+            # The write lock blocks, so keep it off the event loop
+            with span("index_write", count=len(vectors)):
+                added = await run_in_thread(self._add_locked, vectors, metadatas, model)
+            self.refresh()
+            logger.info(f"Added {added} document(s) to the vector store")
+            return True
+        except Exception as e:
+            logger.error(f"Error adding document: {str(e)}")
+            return False
+
+    def _add_locked(self, vectors: List[List[float]], metadatas: List[Dict[str, Any]],
+                    model: Optional[str] = None) -> int:
+        with self.write_lock():
+            generation = self.current_generation()
+            if generation:
+                # The writer only needs fingerprints, not a loaded HNSW/IVF index
+                base = self._open(generation, load_index=False)
+                config = dict(base.config)
+                segments = list(base.segment_info)
+                deleted = base.deleted
+            else:
+                base = None
+                config = {'build_id': uuid.uuid4().hex}
+                segments = []
+                deleted = None
+
+            # A re-index may have switched models since the caller embedded
+            if model:
+                if config.get('model', model) != model:
+                    raise ValueError(f"Live index uses {config['model']}, vectors were embedded with {model}")
+                config['model'] = model
+            if vectors and config.get('dimension', len(vectors[0])) != len(vectors[0]):
+                raise ValueError(f"Live index has dimension {config['dimension']}, vectors have {len(vectors[0])}")
+
+            # Skip content another writer indexed since the caller checked,
+            # together with the rest of its chunks, which follow chunk 0
+            new_metadata = []
+            new_vectors = []
+            seen = set()
+            skipping = False
+            for vector, metadata in zip(vectors, metadatas):
+                if metadata.get('chunk', 0) == 0:
+                    skipping = False
+                    if metadata.get('fingerprint'):
+                        key = _fingerprint_key(metadata.get('patient_id'), metadata['fingerprint'])
+                        skipping = (base is not None and base.document_id(key) is not None) or key in seen
+                        seen.add(key)
+                if skipping:
+                    continue
+                new_vectors.append(vector)
+                new_metadata.append(metadata)
+
+            if new_vectors:
+                vectors = np.array(new_vectors, dtype=np.float32)
+                config['dimension'] = vectors.shape[1]
+                segments.append(self._write_segment(new_metadata, vectors=vectors))
+                segments = self._merge_trailing(segments, config['dimension'])
+                self._publish(generation + 1, segments, config, deleted)
+            return len(new_vectors)
+
+    async def delete_document(self, key: str) -> int:
+        """Delete every vector of the document stored under `key`; returns how many"""
+        with span("index_delete"):
+            deleted = await run_in_thread(self._delete_locked, key)
+        self.refresh()
+        if deleted:
+            logger.info(f"Deleted {deleted} vector(s) of document {key}")
+        return deleted
+
+    def _delete_locked(self, key: str) -> int:
+        with self.write_lock():
+            generation = self.current_generation()
+            if not generation:
+                return 0
+            base = self._open(generation, load_index=False)
+            first = base.document_id(key)
+            if first is None:
+                return 0
+
+            # A document's chunks are written together, right after chunk 0
+            document = base.metadata(first).get('fingerprint')
+            ids = [first]
+            while ids[-1] + 1 < len(base):
+                metadata = base.metadata(ids[-1] + 1)
+                if metadata.get('chunk', 0) == 0 or metadata.get('document') != document:
+                    break
+                ids.append(ids[-1] + 1)
+
+            # Tombstones only: the segments are shared with other generations
+            deleted = np.union1d(base.deleted, np.array(ids, dtype=np.int64))
+            self._publish(generation + 1, list(base.segment_info), base.config, deleted)
+            return len(ids)
+
+    def publish_generation(self, index, metadatas: List[Dict[str, Any]], fingerprints: Dict[str, int],
+                           config: Dict[str, Any], catch_up: Optional[Callable[[int], None]] = None,
+                           deleted: Optional[List[int]] = None) -> int:
+        """Atomically replace the live index with a completely new generation.
+
+        `catch_up(live_generation)` runs under the write lock just before the
+        switch, so the caller can fold in documents written since it started
+        (and add to `deleted` the ids of documents deleted meanwhile).
+        """
+        with self.write_lock():
+            generation = self.current_generation()
+            if catch_up:
+                catch_up(generation)
+            segment = self._write_segment(metadatas, index=index, fingerprints=fingerprints)
+            self._publish(generation + 1, [segment], {**config, 'build_id': uuid.uuid4().hex, 'dimension': index.d},
+                          np.unique(np.array(deleted or [], dtype=np.int64)))
+        self.refresh()
+        return generation + 1
+
+    def _write_segment(self, metadatas: List[Dict[str, Any]], vectors: Optional[np.ndarray] = None,
+                       index=None, fingerprints: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Write an immutable segment from `vectors` or a complete FAISS `index`"""
+        name = f"seg-{uuid.uuid4().hex}"
+        tmp_directory = os.path.join(self.segments_path, f"{name}.tmp")
+        os.makedirs(tmp_directory)
+
+        # Every segment keeps raw vectors; HNSW/IVF indexes are stored as well
+        vectors_path = os.path.join(tmp_directory, "vectors.f32")
+        has_index = index is not None and not isinstance(index, faiss.IndexFlat)
+        if index is not None:
+            if isinstance(index, faiss.IndexIVF):
+                index.make_direct_map()
+            vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d))
+        np.ascontiguousarray(vectors, dtype=np.float32).tofile(vectors_path)
+        if has_index:
+            faiss.write_index(index, os.path.join(tmp_directory, "index.faiss"))
+
+        offsets = [0]
+        with open(os.path.join(tmp_directory, "metadata.jsonl"), 'wb') as f:
+            for metadata in metadatas:
+                line = json.dumps(metadata).encode('utf-8') + b'\n'
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        np.save(os.path.join(tmp_directory, "offsets.npy"), np.array(offsets, dtype=np.int64))
+
+        if fingerprints is None:
+            fingerprints = {
+                _fingerprint_key(m.get('patient_id'), m['fingerprint']): idx
+                for idx, m in enumerate(metadatas) if m.get('fingerprint')
+            }
+        with open(os.path.join(tmp_directory, "fingerprints.json"), 'w') as f:
+            json.dump(fingerprints, f)
+        with open(os.path.join(tmp_directory, "patients.json"), 'w') as f:
+            json.dump(_patient_ids(metadatas), f)
+
+        os.replace(tmp_directory, os.path.join(self.segments_path, name))
+        return {'name': name, 'count': len(metadatas), 'index': has_index}
+
+    def _merge_trailing(self, segments: List[Dict[str, Any]], dimension: int) -> List[Dict[str, Any]]:
+        """Merge small trailing flat segments so a generation never has many segments"""
+        while (len(segments) >= 2 and not segments[-2]['index']
+               and segments[-2]['count'] <= segments[-1]['count'] * MERGE_FACTOR):
+            segments[-2:] = [self._merge_segments(segments[-2:])]
+        return segments
+
+    def _merge_segments(self, infos: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Concatenate consecutive flat segments; vector ids keep their order"""
+        name = f"seg-{uuid.uuid4().hex}"
+        tmp_directory = os.path.join(self.segments_path, f"{name}.tmp")
+        os.makedirs(tmp_directory)
+        offsets = [np.zeros(1, dtype=np.int64)]
+        fingerprints = {}
+        patients: Dict[str, List[int]] = {}
+        count = 0
+        with open(os.path.join(tmp_directory, "vectors.f32"), 'wb') as vectors_file, \
+                open(os.path.join(tmp_directory, "metadata.jsonl"), 'wb') as metadata_file:
+            for info in infos:
+                directory = os.path.join(self.segments_path, info['name'])
+                with open(os.path.join(directory, "vectors.f32"), 'rb') as f:
+                    shutil.copyfileobj(f, vectors_file)
+                segment_offsets = np.load(os.path.join(directory, "offsets.npy"))
+                with open(os.path.join(directory, "metadata.jsonl"), 'rb') as f:
+                    shutil.copyfileobj(f, metadata_file)
+                offsets.append(segment_offsets[1:] + offsets[-1][-1])
+                with open(os.path.join(directory, "fingerprints.json"), 'r') as f:
+                    fingerprints.update((key, count + idx) for key, idx in json.load(f).items())
+                for patient_id, ids in _load_patients(directory).items():
+                    patients.setdefault(patient_id, []).extend(count + idx for idx in ids)
+                count += info['count']
+        np.save(os.path.join(tmp_directory, "offsets.npy"), np.concatenate(offsets))
+        with open(os.path.join(tmp_directory, "fingerprints.json"), 'w') as f:
+            json.dump(fingerprints, f)
+        with open(os.path.join(tmp_directory, "patients.json"), 'w') as f:
+            json.dump(patients, f)
+        os.replace(tmp_directory, os.path.join(self.segments_path, name))
+        return {'name': name, 'count': count, 'index': False}
+
+    def _publish(self, generation: int, segments: List[Dict[str, Any]], config: Dict[str, Any],
+                 deleted: Optional[np.ndarray] = None):
+        """Write a generation directory and point CURRENT at it (caller holds the write lock)"""
+        name = _generation_name(generation)
+        tmp_directory = os.path.join(self.path, f"{name}.tmp")
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        with open(os.path.join(tmp_directory, "config.json"), 'w') as f:
+            json.dump(config, f)
+        with open(os.path.join(tmp_directory, "segments.json"), 'w') as f:
+            json.dump(segments, f)
+        if deleted is not None and len(deleted):
+            np.save(os.path.join(tmp_directory, "deleted.npy"), deleted.astype(np.int64))
+
+        os.replace(tmp_directory, os.path.join(self.path, name))
+        tmp_current = f"{self.current_path}.tmp"
+        with open(tmp_current, 'w') as f:
+            f.write(name)
+        os.replace(tmp_current, self.current_path)
+        logger.info(f"Published index generation {generation} with {len(segments)} segment(s)")
+        self._cleanup(generation)
+
+    def _cleanup(self, generation: int):
+        """Remove generations older than KEEP_GENERATIONS and segments no generation uses.
+
+        Open mmaps stay valid after unlink, so readers of an older generation
+        keep working until they refresh.
+        """
+        referenced = set()
+        for entry in os.listdir(self.path):
+            if not entry.startswith("gen-"):
+                continue
+            directory = os.path.join(self.path, entry)
+            try:
+                old = int(entry.split('-')[-1])
+            except ValueError:
+                continue
+            if entry.endswith(".tmp") or old <= generation - KEEP_GENERATIONS:
+                shutil.rmtree(directory, ignore_errors=True)
+            elif os.path.exists(os.path.join(directory, "segments.json")):
+                referenced.update(info['name'] for info in _read_segments(directory))
+        for entry in os.listdir(self.segments_path):
+            if entry not in referenced:
+                shutil.rmtree(os.path.join(self.segments_path, entry), ignore_errors=True)
+
+    def _migrate_legacy(self):
+        """Convert a single-file index.faiss/metadata.json store into the first generation"""
+        legacy_index = os.path.join(self.path, "index.faiss")
+        legacy_metadata = os.path.join(self.path, "metadata.json")
+        if not os.path.exists(legacy_index):
+            return
+        with self.write_lock():
+            if self.current_generation() or not os.path.exists(legacy_index):
+                return
+            index = faiss.read_index(legacy_index)
+            metadata = []
+            if os.path.exists(legacy_metadata):
+                with open(legacy_metadata, 'r') as f:
+                    metadata = json.load(f)
+            segment = self._write_segment(metadata, index=index)
+            self._publish(1, [segment], {'build_id': uuid.uuid4().hex, 'dimension': index.d})
+            os.remove(legacy_index)
+            if os.path.exists(legacy_metadata):
+                os.remove(legacy_metadata)
+            logger.info(f"Migrated legacy index with {index.ntotal} vectors")
+
+    def _migrate_unsegmented(self):
+        """Move a generation that holds its files directly into a segment"""
+        generation = self.current_generation()
+        directory = os.path.join(self.path, _generation_name(generation))
+        if not generation or os.path.exists(os.path.join(directory, "segments.json")):
+            return
+        with self.write_lock():
+            generation = self.current_generation()
+            directory = os.path.join(self.path, _generation_name(generation))
+            if os.path.exists(os.path.join(directory, "segments.json")):
+                return
+            config = _read_config(directory)
+            name = f"seg-{uuid.uuid4().hex}"
+            tmp_directory = os.path.join(self.segments_path, f"{name}.tmp")
+            os.makedirs(tmp_directory)
+            for filename in ("vectors.f32", "index.faiss", "metadata.jsonl", "offsets.npy", "fingerprints.json"):
+                if os.path.exists(os.path.join(directory, filename)):
+                    shutil.copyfile(os.path.join(directory, filename), os.path.join(tmp_directory, filename))
+            index_path = os.path.join(tmp_directory, "index.faiss")
+            has_index = os.path.exists(index_path)
+            if has_index and not os.path.exists(os.path.join(tmp_directory, "vectors.f32")):
+                index = faiss.read_index(index_path)
+                if isinstance(index, faiss.IndexIVF):
+                    index.make_direct_map()
+                index.reconstruct_n(0, index.ntotal).astype(np.float32).tofile(
+                    os.path.join(tmp_directory, "vectors.f32"))
+                config['dimension'] = index.d
+            os.replace(tmp_directory, os.path.join(self.segments_path, name))
+            count = len(np.load(os.path.join(self.segments_path, name, "offsets.npy"), mmap_mode='r')) - 1
+            self._publish(generation + 1, [{'name': name, 'count': count, 'index': has_index}], config)
+            logger.info(f"Moved index generation {generation} into segment {name}")
+
+    async def search(self, query_vector: List[float], k: int = 3, patient_id: Optional[str] = None):
+        """Search for similar documents"""
+        results = await self.search_batch([query_vector], k, [patient_id])
+        return results[0] if results else []
+
+    def _search_snapshot(self, snapshot: IndexSnapshot, query_np: np.ndarray, k: int,
+                         patient_ids: List[Optional[str]]) -> List[List[Dict[str, Any]]]:
+        """Unfiltered queries search the whole index; filtered ones only the patient's vectors"""
+        groups: Dict[Optional[str], List[int]] = {}
+        for row, patient_id in enumerate(patient_ids):
+            groups.setdefault(patient_id or None, []).append(row)
+
+        batch_results: List[List[Dict[str, Any]]] = [[] for _ in patient_ids]
+        for patient_id, rows in groups.items():
+            with span("faiss_search", k=k, queries=len(rows), ntotal=snapshot.ntotal, filtered=bool(patient_id)):
+                if patient_id:
+                    scores, indices = snapshot.search_patient(query_np[rows], k, patient_id)
+                else:
+                    scores, indices = snapshot.search(query_np[rows], k)
+
+            for row, row_scores, row_indices in zip(rows, scores, indices):
+                for score, idx in zip(row_scores, row_indices):
+                    if idx < 0:
+                        continue
+                    metadata = snapshot.metadata(idx)
+                    batch_results[row].append({
+                        'id': metadata.get('id', str(idx)),
+                        'score': float(score),
+                        'metadata': metadata
+                    })
+        return batch_results
+
+    async def search_batch(self, query_vectors: List[List[float]], k: int = 3,
+                           patient_ids: Optional[List[Optional[str]]] = None) -> List[List[Dict[str, Any]]]:
+        """Search for similar documents for many queries with one index search"""
+        try:
+            snapshot = self.refresh()
+            if snapshot is None or not query_vectors:
+                return [[] for _ in query_vectors]
+            patient_ids = patient_ids or [None] * len(query_vectors)
+
+            # Convert query vectors to one numpy matrix
+            query_np = np.array(query_vectors, dtype=np.float32)
+            if query_np.shape[1] != snapshot.d:
+                # Embedded just before a re-index with another model went live
+                logger.error(f"Query dimension {query_np.shape[1]} does not match the live index ({snapshot.d})")
+                return [[] for _ in query_vectors]
+
+            if not snapshot.ntotal:
+                return [[] for _ in query_vectors]
+
+            # Exact search is CPU-bound, so keep it off the event loop
+            batch_results = await run_in_thread(self._search_snapshot, snapshot, query_np, k, patient_ids)
+            logger.info(f"Found {sum(len(r) for r in batch_results)} similar documents for {len(query_vectors)} queries")
+            return batch_results
+
+        except Exception as e:
+            logger.error(f"Error searching: {str(e)}")
+            return [[] for _ in query_vectors]
+
+
+_vector_store: Optional[VectorStore] = None
+
+
+def get_vector_store() -> VectorStore:
+    """Process-wide vector store (one per worker process)"""
+    global _vector_store
+    if _vector_store is None:
+        _vector_store = VectorStore()
+    return _vector_store
@@ -0,0 +1,123 @@
+import os
+import asyncio
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Summaries are keyed by the document's content fingerprint, so a changed
+# document gets a new summary and an unchanged one is never summarised twice
+SUMMARY_DB_PATH = os.getenv(
+    "SUMMARY_DB_PATH", os.path.join(os.getenv("VECTOR_STORE_DIR", "vector_store"), "summaries.db")
+)
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "2"))
+SUMMARY_INPUT_CHARS = 4000
+# Reports waiting for a summary; beyond this new ones are left to backfill.py
+SUMMARY_MAX_PENDING = int(os.getenv("SUMMARY_MAX_PENDING", "256"))
+
+SUMMARY_PROMPT = """You are a medical AI assistant. Summarize the following medical report in at most three sentences. Keep key findings, diagnoses, lab values with units, dates and recommendations. Be precise and professional.
+
+Report: {text}
+Summary: """
+
+
+class SummaryStore:
+    """SQLite table of report summaries next to the vector index"""
+
+    def __init__(self, path: str = SUMMARY_DB_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    fingerprint TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+
+    def get_many(self, fingerprints: List[str]) -> Dict[str, str]:
+        fingerprints = [fp for fp in fingerprints if fp]
+        if not fingerprints:
+            return {}
+        placeholders = ",".join("?" for _ in fingerprints)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT fingerprint, summary FROM summaries WHERE fingerprint IN ({placeholders})",
+                fingerprints
+            ).fetchall()
+        return dict(rows)
+
+    def has(self, fingerprint: str) -> bool:
+        return bool(self.get_many([fingerprint]))
+
+    def put(self, fingerprint: str, summary: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries (fingerprint, summary, created_at) VALUES (?, ?, ?)",
+                (fingerprint, summary, datetime.now().isoformat())
+            )
+
+
+class ReportSummarizer:
+    """Background summarisation of newly indexed reports.
+
+    `generate` is any async callable taking a prompt and returning text (or
+    None on failure), so the local LLM client can be swapped freely. At most
+    `concurrency` summaries are generated at a time and at most `max_pending`
+    reports are held waiting for one.
+    """
+
+    def __init__(self, generate: Callable[[str], Awaitable[Optional[str]]],
+                 store: SummaryStore, concurrency: int = SUMMARY_CONCURRENCY,
+                 max_pending: int = SUMMARY_MAX_PENDING):
+        self.generate = generate
+        self.store = store
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending = set()
+        self._tasks = set()
+
+    def submit(self, fingerprint: str, text: str) -> bool:
+        """Schedule a summary unless one exists, is already being made or the backlog is full"""
+        if not fingerprint or fingerprint in self._pending or self.store.has(fingerprint):
+            return False
+        if len(self._pending) >= self.max_pending:
+            logger.warning(f"Summary backlog full, skipping document {fingerprint[:12]} (run backfill.py later)")
+            return False
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._pending.add(fingerprint)
+        # Hold only the part of the report that goes into the prompt
+        task = asyncio.create_task(self._summarize(fingerprint, text[:SUMMARY_INPUT_CHARS]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _summarize(self, fingerprint: str, text: str):
+        try:
+            async with self._semaphore:
+                summary = await self.generate(SUMMARY_PROMPT.format(text=text))
+            if not summary:
+                logger.warning(f"No summary generated for document {fingerprint[:12]}")
+                return
+            self.store.put(fingerprint, summary.strip())
+            logger.info(f"Stored summary for document {fingerprint[:12]}")
+        except Exception as e:
+            logger.error(f"Error summarizing document: {str(e)}")
+        finally:
+            self._pending.discard(fingerprint)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def wait(self, max_pending: int = 0):
+        """Wait until at most `max_pending` summaries are still being made"""
+        while len(self._tasks) > max_pending:
+            await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
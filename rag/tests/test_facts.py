@@ -0,0 +1,90 @@
+import pytest
+
+from facts import FactStore, answer_structured, extract_facts, parse_structured_query
+
+
+def labs(text):
+    return [(f['lab'], f['value'], f['unit']) for f in extract_facts(text, {})['labs']]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FactStore(str(tmp_path / "facts.db"))
+
+
+def test_reference_range_is_not_the_result():
+    assert labs("HbA1c (ref 4.0-5.6): 7.2 %") == [('hba1c', 7.2, '%')]
+    assert labs("Glucose reference range 70-99 mg/dL result 180 mg/dL") == [('glucose', 180.0, 'mg/dL')]
+    assert labs("TSH 2.1 uIU/mL (0.4-4.0)") == [('tsh', 2.1, 'mIU/L')]
+
+
+def test_units_are_converted_to_the_canonical_unit():
+    assert labs("HbA1c 53 mmol/mol") == [('hba1c', 7.0, '%')]
+    assert labs("Glucose: 6.1 mmol/L\nHemoglobin 135 g/L") == [
+        ('glucose', 109.9, 'mg/dL'), ('hemoglobin', 13.5, 'g/dL')
+    ]
+    assert labs("Creatinine 88 umol/L") == [('creatinine', 1.0, 'mg/dL')]
+
+
+def test_values_in_unknown_units_are_skipped():
+    assert labs("Glucose 12 ng/mL") == []
+
+
+def test_values_qualified_by_a_bound_are_skipped():
+    assert labs("TSH <0.01 mIU/L") == []
+    assert labs("HbA1c >14%\nGlucose 180 mg/dL") == [('glucose', 180.0, 'mg/dL')]
+    assert labs("eGFR > 90 mL/min/1.73m2") == []
+
+
+def test_hba1c_and_hemoglobin_are_told_apart():
+    assert labs("Hemoglobin A1c: 8.1%  Hemoglobin: 13.2 g/dL") == [
+        ('hba1c', 8.1, '%'), ('hemoglobin', 13.2, 'g/dL')
+    ]
+
+
+@pytest.mark.parametrize("question", [
+    "Which medications is the diabetic patient taking?",
+    "What did the doctor say about glucose at the last visit?",
+    "Why is the HbA1c high?",
+    "Does the patient have diabetes?",
+])
+def test_narrative_questions_are_not_structured(question):
+    assert parse_structured_query(question) is None
+
+
+def test_structured_questions_are_recognised():
+    parsed = parse_structured_query("Which patients had HbA1c above 7 in 2023?")
+    assert (parsed.lab, parsed.op, parsed.threshold) == ('hba1c', '>', 7.0)
+    assert (parsed.start, parsed.end) == ('2023-01-01', '2024-01-01')
+
+    assert parse_structured_query("What is the current hemoglobin level?").aggregate == 'latest'
+    assert parse_structured_query("How many patients have diabetes?").diagnoses == ['E11']
+
+
+def test_threshold_is_read_after_the_lab():
+    parsed = parse_structured_query("Patients over 65 with glucose below 70")
+    assert (parsed.lab, parsed.op, parsed.threshold) == ('glucose', '<', 70.0)
+
+
+def test_no_matching_facts_falls_through(store):
+    assert answer_structured(store, parse_structured_query("What is the current hemoglobin level?"), "p1") is None
+    assert answer_structured(store, parse_structured_query("How many patients have diabetes?")) is None
+
+
+def test_answers_from_stored_facts(store):
+    store.add_document("doc", "Date: 2024-03-01\nHbA1c 7.9 %\nType 2 diabetes", {'patient_id': 'p1'})
+    answer = answer_structured(store, parse_structured_query("What is the latest HbA1c?"), "p1")
+    assert answer == "HbA1c: 7.9% on 2024-03-01."
+    assert answer_structured(store, parse_structured_query("How many patients have diabetes?")).startswith("1 patient")
+
+
+def test_same_document_for_two_patients_keeps_both(store):
+    text = "Date: 2024-03-01\nGlucose 140 mg/dL"
+    store.add_document("doc", text, {'patient_id': 'p1'})
+    store.add_document("doc", text, {'patient_id': 'p2'})
+    store.add_document("doc", text, {'patient_id': 'p1'})
+
+    rows = store.query("SELECT patient_id FROM lab_results ORDER BY patient_id", ())
+    assert rows == [('p1',), ('p2',)]
+    assert store.has_document("doc", "p2")
+    assert not store.has_document("doc", "p3")
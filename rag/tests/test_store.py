@@ -0,0 +1,121 @@
+import asyncio
+
+import numpy as np
+
+from store import VectorStore
+
+
+def test_patient_filter_finds_matches_beyond_the_global_top_k(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.random((2000, 16)).astype(np.float32)
+    metadatas = [
+        {'id': str(i), 'patient_id': 'rare' if i % 500 == 0 else 'common', 'text': 't'}
+        for i in range(len(vectors))
+    ]
+    store = VectorStore(str(tmp_path / "vector_store"))
+    query = rng.random(16).astype(np.float32)
+
+    async def main():
+        await store.add_documents(vectors.tolist(), metadatas)
+        return await store.search_batch([query.tolist()] * 2, k=3, patient_ids=['rare', None])
+
+    rare, unfiltered = asyncio.run(main())
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    expected = [str(i) for i in np.argsort(distances) if metadatas[i]['patient_id'] == 'rare'][:3]
+    assert [result['id'] for result in rare] == expected
+    assert [result['id'] for result in unfiltered] == [str(i) for i in np.argsort(distances)[:3]]
+
+
+def test_appends_add_delta_segments_without_copying_the_index(tmp_path):
+    rng = np.random.default_rng(1)
+    store = VectorStore(str(tmp_path / "vector_store"))
+    batches = [rng.random((16, 8)).astype(np.float32) for _ in range(64)]
+
+    async def main():
+        for w, batch in enumerate(batches):
+            metadatas = [{'id': f'{w}-{i}', 'fingerprint': f'{w}-{i}', 'text': 't'} for i in range(len(batch))]
+            assert await store.add_documents(batch.tolist(), metadatas)
+
+    asyncio.run(main())
+    snapshot = store.refresh()
+    vectors = np.concatenate(batches)
+    assert snapshot.ntotal == len(vectors)
+    assert len(snapshot.segments) <= 7
+    assert snapshot.metadata(16 * 40 + 3)['id'] == '40-3'
+
+    queries = rng.random((4, 8)).astype(np.float32)
+    _, ids = snapshot.search(queries, 5)
+    expected = np.argsort(((vectors[None] - queries[:, None]) ** 2).sum(axis=2), axis=1)[:, :5]
+    assert (ids == expected).all()
+
+
+def test_deleted_document_is_dropped_from_search_and_can_be_re_added(tmp_path):
+    from chunking import iter_documents
+
+    rng = np.random.default_rng(2)
+    store = VectorStore(str(tmp_path / "vector_store"))
+    vectors = rng.random((6, 8)).astype(np.float32)
+    # Two documents of three chunks each
+    metadatas = [
+        {'patient_id': 'p1', 'text': f'{d}{c}', 'document': f'doc{d}', 'chunk': c,
+         **({'fingerprint': f'doc{d}'} if c == 0 else {})}
+        for d in range(2) for c in range(3)
+    ]
+
+    async def main():
+        await store.add_documents(vectors.tolist(), metadatas)
+        assert await store.delete_document('p1|doc0') == 3
+        assert await store.delete_document('p1|doc0') == 0
+        return (await store.search_batch([vectors[0].tolist()], k=6, patient_ids=[None]))[0]
+
+    results = asyncio.run(main())
+    assert sorted(result['metadata']['text'] for result in results) == ['10', '11', '12']
+    assert store.find_duplicate('doc0', 'p1') is None
+    assert [doc['text'] for doc, _ in iter_documents(store.refresh().iter_metadata())] == ['101112']
+
+    asyncio.run(store.add_documents(vectors[:3].tolist(), metadatas[:3]))
+    assert store.find_duplicate('doc0', 'p1') is not None
+
+
+def test_duplicate_documents_are_skipped_with_all_their_chunks(tmp_path):
+    store = VectorStore(str(tmp_path / "vector_store"))
+
+    def chunks(document):
+        return [
+            {'patient_id': 'p1', 'text': f'{document}{c}', 'document': document, 'chunk': c,
+             **({'fingerprint': document} if c == 0 else {})}
+            for c in range(3)
+        ]
+
+    async def main():
+        assert await store.add_documents(np.ones((3, 4)).tolist(), chunks('a'))
+        # 'a' is already indexed and 'b' repeats within the batch
+        metadatas = chunks('a') + chunks('b') + chunks('b')
+        assert await store.add_documents(np.ones((9, 4)).tolist(), metadatas)
+
+    asyncio.run(main())
+    texts = [metadata['text'] for metadata in store.refresh().iter_metadata()]
+    assert texts == ['a0', 'a1', 'a2', 'b0', 'b1', 'b2']
+
+
+def test_patient_filter_searches_merged_segments_exactly(tmp_path):
+    rng = np.random.default_rng(3)
+    store = VectorStore(str(tmp_path / "vector_store"))
+    batches = [rng.random((10, 8)).astype(np.float32) for _ in range(20)]
+    metadatas = [
+        [{'id': f'{w}-{i}', 'patient_id': f'p{i % 3}', 'text': 't'} for i in range(10)]
+        for w in range(20)
+    ]
+    query = rng.random(8).astype(np.float32)
+
+    async def main():
+        for batch, batch_metadatas in zip(batches, metadatas):
+            await store.add_documents(batch.tolist(), batch_metadatas)
+        return await store.search_batch([query.tolist()], k=4, patient_ids=['p1'])
+
+    results = asyncio.run(main())[0]
+    assert len(store.refresh().segments) > 1
+    vectors = np.concatenate(batches)
+    flat = [metadata for batch_metadatas in metadatas for metadata in batch_metadatas]
+    order = np.argsort(((vectors - query) ** 2).sum(axis=1))
+    assert [result['id'] for result in results] == [flat[i]['id'] for i in order if flat[i]['patient_id'] == 'p1'][:4]
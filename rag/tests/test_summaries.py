@@ -0,0 +1,26 @@
+import asyncio
+
+from summaries import SUMMARY_INPUT_CHARS, ReportSummarizer, SummaryStore
+
+
+def test_backlog_is_capped_and_holds_only_the_prompt_text(tmp_path):
+    async def main():
+        release = asyncio.Event()
+
+        async def generate(prompt):
+            await release.wait()
+            return "summary"
+
+        summarizer = ReportSummarizer(generate, SummaryStore(str(tmp_path / "summaries.db")),
+                                      concurrency=1, max_pending=2)
+        submitted = [summarizer.submit(f"doc{i}", "x" * (SUMMARY_INPUT_CHARS * 10)) for i in range(3)]
+        # Queued tasks keep only the truncated text alive
+        held = [len(task.get_coro().cr_frame.f_locals['text']) for task in summarizer._tasks]
+        release.set()
+        await summarizer.wait()
+        return submitted, held, summarizer.store
+
+    submitted, held, store = asyncio.run(main())
+    assert submitted == [True, True, False]
+    assert held == [SUMMARY_INPUT_CHARS] * 2
+    assert store.has("doc1") and not store.has("doc2")
@@ -0,0 +1,328 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import secrets
+import logging
+import weakref
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Spans are exported as one JSON log line each on the "tracing" logger and
+# trace context travels between services in the W3C traceparent header.
+#
+# backend/tracing.py and rag/tracing.py must stay identical (enforced by
+# backend/tests/test_tracing.py); each service is named by SERVICE_NAME or,
+# by default, by the directory it runs from.
+logger = logging.getLogger("tracing")
+
+SERVICE_NAME = os.getenv("SERVICE_NAME") or os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+TRACE_HEADER = "traceparent"
+
+# Requests slower than this get their sampled stacks logged. Profiling is
+# opt-in: it is off unless SLOW_REQUEST_MS is set to a positive value
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000
+PROFILE_TOP_STACKS = 20
+PROFILE_MAX_DEPTH = 40
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_profile_session: contextvars.ContextVar = contextvars.ContextVar("profile_session", default=None)
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start', 'duration_ms', 'attributes')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.attributes = attributes
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+def parse_traceparent(value: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Return (trace_id, parent_span_id) from a traceparent header, or (None, None)"""
+    if not value:
+        return None, None
+    parts = value.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+def start_span(name: str, traceparent: Optional[str] = None, **attributes) -> Tuple[Span, Any]:
+    """Start a span as a child of `traceparent` or of the current span"""
+    trace_id, parent_id = parse_traceparent(traceparent)
+    if trace_id is None:
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id = secrets.token_hex(16)
+    span = Span(name, trace_id, parent_id, attributes)
+    return span, _current_span.set(span)
+
+
+def end_span(span: Span, token: Any = None):
+    """Finish a span, restore the previous current span and export it"""
+    span.duration_ms = (time.perf_counter() - span.start) * 1000
+    if token is not None:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Ended from a different context (e.g. a streamed response)
+            pass
+    if TRACING_ENABLED and logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({
+            'service': SERVICE_NAME,
+            'trace_id': span.trace_id,
+            'span_id': span.span_id,
+            'parent_id': span.parent_id,
+            'name': span.name,
+            'duration_ms': round(span.duration_ms, 2),
+            **span.attributes
+        }, default=str))
+
+
+@contextmanager
+def span(name: str, traceparent: Optional[str] = None, **attributes):
+    """Time a block of work as a span"""
+    current, token = start_span(name, traceparent, **attributes)
+    try:
+        yield current
+    except Exception as e:
+        current.set(error=str(e))
+        raise
+    finally:
+        end_span(current, token)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def trace_headers() -> Dict[str, str]:
+    """Headers that continue the current trace in another service"""
+    current = _current_span.get()
+    return {TRACE_HEADER: current.traceparent} if current is not None else {}
+
+
+def current_traceparent() -> Optional[str]:
+    current = _current_span.get()
+    return current.traceparent if current is not None else None
+
+
+class _ProfileSession:
+    __slots__ = ('loop', 'threads', 'samples')
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop]):
+        self.loop = loop
+        self.threads: Counter = Counter()  # worker threads running work for the request
+        self.samples: Counter = Counter()
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of the work done for requests while any are profiled.
+
+    On the event loop thread a sample goes to the request whose task (or a
+    task it spawned) is running at that moment; time the loop spends idle is
+    not sampled. Worker threads are sampled while they run work handed off
+    with run_in_thread. Each thread's stack is collapsed once per tick.
+    Samples are discarded unless the request turns out slow.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._sessions: Dict[int, _ProfileSession] = {}
+        self._loop_threads: Dict[asyncio.AbstractEventLoop, int] = {}
+        self._task_sessions: "weakref.WeakKeyDictionary[asyncio.Task, int]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_id = 0
+
+    def start(self) -> int:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            self._next_id += 1
+            session_id = self._next_id
+            self._sessions[session_id] = _ProfileSession(loop)
+            if loop is not None:
+                if loop not in self._loop_threads:
+                    self._loop_threads[loop] = threading.get_ident()
+                    self._instrument(loop)
+                task = asyncio.current_task(loop)
+                if task is not None:
+                    self._task_sessions[task] = session_id
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return session_id
+
+    def stop(self, session_id: int) -> Counter:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if not self._sessions:
+                self._wakeup.clear()
+        return session.samples if session is not None else Counter()
+
+    def attach(self, session_id: Optional[int]) -> bool:
+        """Sample the calling thread for a request until detach()"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            session.threads[threading.get_ident()] += 1
+            return True
+
+    def detach(self, session_id: int):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                thread_id = threading.get_ident()
+                session.threads[thread_id] -= 1
+                if session.threads[thread_id] <= 0:
+                    del session.threads[thread_id]
+
+    def _instrument(self, loop: asyncio.AbstractEventLoop):
+        """Credit tasks created during a profiled request to that request"""
+        previous = loop.get_task_factory()
+
+        def factory(loop, coro, **kwargs):
+            if previous is not None:
+                task = previous(loop, coro, **kwargs)
+            else:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            session_id = _profile_session.get()
+            if session_id is not None:
+                with self._lock:
+                    self._task_sessions[task] = session_id
+            return task
+
+        loop.set_task_factory(factory)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            stacks: Dict[int, Optional[str]] = {}
+
+            def stack(thread_id: int) -> Optional[str]:
+                if thread_id not in stacks:
+                    frame = frames.get(thread_id)
+                    stacks[thread_id] = _collapse(frame) if frame is not None else None
+                return stacks[thread_id]
+
+            with self._lock:
+                for loop, thread_id in self._loop_threads.items():
+                    task = asyncio.current_task(loop)
+                    session = self._sessions.get(self._task_sessions.get(task)) if task is not None else None
+                    if session is not None and stack(thread_id):
+                        session.samples[stack(thread_id)] += 1
+                for session in self._sessions.values():
+                    for thread_id in session.threads:
+                        if stack(thread_id):
+                            session.samples[stack(thread_id)] += 1
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+profiler = SlowRequestProfiler()
+
+
+def current_profile() -> Optional[int]:
+    """Profiling session of the current request, if it is being profiled"""
+    return _profile_session.get()
+
+
+@contextmanager
+def profiling(session_id: Optional[int]):
+    """Credit work started in this block to another request's profile"""
+    token = _profile_session.set(session_id)
+    try:
+        yield
+    finally:
+        _profile_session.reset(token)
+
+
+async def run_in_thread(func: Callable, *args, **kwargs):
+    """asyncio.to_thread that keeps the worker thread in the request's profile"""
+    session_id = _profile_session.get()
+    if session_id is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def run():
+        attached = profiler.attach(session_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if attached:
+                profiler.detach(session_id)
+
+    return await asyncio.to_thread(run)
+
+
+def start_request(name: str, traceparent: Optional[str] = None, **attributes) -> Dict[str, Any]:
+    """Open the root span for an incoming request and start profiling it"""
+    root, token = start_span(name, traceparent, **attributes)
+    session_id = profiler.start() if SLOW_REQUEST_MS > 0 else None
+    return {
+        'span': root,
+        'token': token,
+        'profile': session_id,
+        'profile_token': _profile_session.set(session_id) if session_id is not None else None
+    }
+
+
+def finish_request(state: Dict[str, Any], **attributes):
+    """Close the request's root span; log a profile if it was slow"""
+    root = state['span']
+    root.set(**attributes)
+    samples = profiler.stop(state['profile']) if state['profile'] is not None else None
+    if state.get('profile_token') is not None:
+        try:
+            _profile_session.reset(state['profile_token'])
+        except ValueError:
+            # Finished from a different context (e.g. a streamed response)
+            pass
+    end_span(root, state['token'])
+    if samples and root.duration_ms >= SLOW_REQUEST_MS:
+        logger.warning(json.dumps({
+            'service': SERVICE_NAME,
+            'event': 'slow_request',
+            'trace_id': root.trace_id,
+            'name': root.name,
+            'duration_ms': round(root.duration_ms, 2),
+            'sample_interval_ms': profiler.interval * 1000,
+            'profile': [
+                {'stack': stack, 'samples': count}
+                for stack, count in samples.most_common(PROFILE_TOP_STACKS)
+            ]
+        }))